@@ -0,0 +1,524 @@
+'''
+bam.py - Read BAM files without samtools.
+author: Xiao-Ou Zhang
+version: 0.1.0
+'''
+
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from cigar import parse_bam
+
+AlignedRead = namedtuple('AlignedRead', 'name chrom pos end flag mapq blocks')
+
+_HEADER = struct.Struct('<BBBBIBBH')
+_RECORD = struct.Struct('<iiBBHHHiiii')
+_INT = struct.Struct('<i')
+_METADATA_BIN = 37450
+_BLOCK_HEADER = struct.Struct('<BBBBIBBHBBHH')
+_BLOCK_SIZE = 65280
+_CIGAR = re.compile(r'(\d+)([MIDNSHP=X])')
+
+
+class BGZFReader:
+    '''
+    Class: BGZFReader
+
+    Usage: f = BGZFReader(fileobj)
+    Notes: random access to BGZF files through virtual offsets
+           (block offset << 16 | offset in the block). The last decompressed
+           blocks are cached, as index chunks often share blocks.
+
+    Functions: f.read(n), f.seek(voffset), f.tell(), f.close()
+    '''
+    cache_size = 16
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._cache = OrderedDict()
+        self._offset = 0
+        self._next = 0
+        self._data = b''
+        self._pos = 0
+        self._load(0)
+
+    def _load(self, offset):
+        if offset in self._cache:
+            self._cache.move_to_end(offset)
+            data, size = self._cache[offset]
+        else:
+            self._file.seek(offset)
+            header = self._file.read(18)
+            if not header:
+                data, size = b'', 0
+            else:
+                assert len(header) == 18 and header[:2] == b'\x1f\x8b', 'Error: not a BGZF file'
+                xlen = _HEADER.unpack_from(header)[7]
+                extra = header[12:] + self._file.read(xlen - 6)
+                size = None
+                n = 0
+                while n < xlen:
+                    slen = struct.unpack_from('<H', extra, n + 2)[0]
+                    if extra[n:n + 2] == b'BC':
+                        size = struct.unpack_from('<H', extra, n + 4)[0] + 1
+                    n += 4 + slen
+                assert size is not None, 'Error: not a BGZF block at {}'.format(offset)
+                cdata = self._file.read(size - xlen - 20)
+                self._file.read(8)
+                data = zlib.decompress(cdata, -15)
+            self._cache[offset] = data, size
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        self._offset, self._next = offset, offset + size
+        self._data, self._pos = data, 0
+
+    def read(self, n):
+        tmp = []
+        while n > 0:
+            if self._pos >= len(self._data):
+                if self._next == self._offset:
+                    break
+                self._load(self._next)
+                continue
+            chunk = self._data[self._pos:self._pos + n]
+            self._pos += len(chunk)
+            n -= len(chunk)
+            tmp.append(chunk)
+        return b''.join(tmp)
+
+    def seek(self, voffset):
+        if voffset >> 16 != self._offset:
+            self._load(voffset >> 16)
+        self._pos = voffset & 0xffff
+
+    def tell(self):
+        if self._pos >= len(self._data) and self._next != self._offset:
+            return self._next << 16
+        return self._offset << 16 | self._pos
+
+    def close(self):
+        self._file.close()
+
+
+class BGZFWriter:
+    '''
+    Class: BGZFWriter
+
+    Usage: f = BGZFWriter(fileobj)
+    Notes: write BGZF (blocked gzip, readable by gzip, tabix and
+           BGZFReader). Data is cut into blocks of at most 65280 bytes, and
+           f.flush() ends the current block so that f.tell() is the virtual
+           offset of the start of a block.
+
+    Functions: f.write(data), f.flush(), f.tell(), f.close()
+    '''
+    def __init__(self, fileobj, level=6):
+        self._file = fileobj
+        self._level = level
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def _block(self, data):
+        compressor = zlib.compressobj(self._level, zlib.DEFLATED, -15)
+        cdata = compressor.compress(data) + compressor.flush()
+        self._file.write(_BLOCK_HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66,
+                                            67, 2, len(cdata) + 25))
+        self._file.write(cdata)
+        self._file.write(struct.pack('<II', zlib.crc32(data), len(data)))
+        self._offset += len(cdata) + 26
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= _BLOCK_SIZE:
+            self._block(bytes(self._buffer[:_BLOCK_SIZE]))
+            del self._buffer[:_BLOCK_SIZE]
+
+    def flush(self):
+        if self._buffer:
+            self._block(bytes(self._buffer))
+            self._buffer.clear()
+
+    def tell(self):
+        return self._offset << 16 | len(self._buffer)
+
+    def close(self):
+        self.flush()
+        self._block(b'')
+        self._file.close()
+
+
+class BamIndex:
+    '''
+    Class: BamIndex
+
+    Usage: index = BamIndex(path)
+    Notes: parse a BAI file once, the bins, linear index and the mapped
+           read counts of every reference are kept in memory.
+
+    Functions: index.chunks(refid, sta, end), index.mapped(refid)
+    '''
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        assert data[:4] == b'BAI\x01', 'Error: {} is not a BAI file'.format(path)
+        self.bins = []
+        self.linear = []
+        self.counts = []
+        n_ref = _INT.unpack_from(data, 4)[0]
+        n = 8
+        for i in range(n_ref):
+            bins = {}
+            count = (0, 0)
+            n_bin = _INT.unpack_from(data, n)[0]
+            n += 4
+            for j in range(n_bin):
+                bin_id, n_chunk = struct.unpack_from('<Ii', data, n)
+                n += 8
+                chunks = struct.unpack_from('<{}Q'.format(2 * n_chunk), data, n)
+                n += 16 * n_chunk
+                if bin_id == _METADATA_BIN:
+                    count = chunks[2:4]
+                else:
+                    bins[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+            n_intv = _INT.unpack_from(data, n)[0]
+            n += 4
+            self.linear.append(struct.unpack_from('<{}Q'.format(n_intv), data, n))
+            n += 8 * n_intv
+            self.bins.append(bins)
+            self.counts.append(count)
+
+    def chunks(self, refid, sta, end):
+        '''
+        index.chunks(refid, sta, end) -> [(beg, end), ...]
+        Merged virtual offset chunks which may hold reads in [sta, end).
+        '''
+        if refid >= len(self.bins):
+            return []
+        bins = self.bins[refid]
+        linear = self.linear[refid]
+        min_offset = linear[sta >> 14] if sta >> 14 < len(linear) else 0
+        tmp = sorted(chunk for i in _reg2bins(sta, end) for chunk in bins.get(i, ())
+                     if chunk[1] > min_offset)
+        merged = []
+        for beg, stop in tmp:
+            if merged and beg <= merged[-1][1]:
+                if stop > merged[-1][1]:
+                    merged[-1][1] = stop
+            else:
+                merged.append([beg, stop])
+        return merged
+
+    def mapped(self, refid):
+        '''
+        index.mapped(refid) -> number of mapped reads on refid.
+        '''
+        return self.counts[refid][0]
+
+
+class BamFile:
+    '''
+    Class: BamFile
+
+    Usage: bam = BamFile(path) or with BamFile(path) as bam:
+    Notes: pure python BAM reader. Region queries use the BAI index next to
+           the BAM file (path.bai or path without .bam + .bai). Reads are
+           returned as AlignedRead(name, chrom, pos, end, flag, mapq,
+           blocks), coordinates are 0-based and half-open like BED, and
+           blocks are split at N the same way as cigar.readsplit. Unmapped
+           reads are skipped.
+
+    Attributes: references, lengths, mapped
+
+    Functions: bam.fetch(chrom, sta, end)
+               bam.fetch_blocks(chrom, sta, end)
+               iter(bam)
+               bam.close()
+    '''
+    def __init__(self, path, index=None):
+        self.path = path
+        self._bgzf = BGZFReader(open(path, 'rb'))
+        assert self._bgzf.read(4) == b'BAM\x01', 'Error: {} is not a BAM file'.format(path)
+        l_text = _INT.unpack(self._bgzf.read(4))[0]
+        self.text = self._bgzf.read(l_text).rstrip(b'\x00').decode('utf-8')
+        self.references = []
+        self.lengths = []
+        for i in range(_INT.unpack(self._bgzf.read(4))[0]):
+            l_name = _INT.unpack(self._bgzf.read(4))[0]
+            self.references.append(self._bgzf.read(l_name)[:-1].decode('utf-8'))
+            self.lengths.append(_INT.unpack(self._bgzf.read(4))[0])
+        self._refid = {name: n for n, name in enumerate(self.references)}
+        self._data = self._bgzf.tell()
+        self._index = index
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = BamIndex(BamFile.indexpath(self.path))
+        return self._index
+
+    @property
+    def mapped(self):
+        '''
+        number of mapped reads, the sum of `samtools idxstats` column 3.
+        '''
+        return sum(self.index.mapped(i) for i in range(len(self.references)))
+
+    def _records(self):
+        while True:
+            size = self._bgzf.read(4)
+            if len(size) < 4:
+                return
+            data = self._bgzf.read(_INT.unpack(size)[0])
+            refid, pos, l_name, mapq, _, n_cigar, flag = _RECORD.unpack_from(data)[:7]
+            yield refid, pos, data, l_name, mapq, n_cigar, flag
+
+    def _read(self, refid, pos, data, l_name, mapq, n_cigar, flag):
+        cigar = data[32 + l_name:32 + l_name + 4 * n_cigar]
+        blocks = [[pos + sta, pos + end] for sta, end in parse_bam(cigar)]
+        end = blocks[-1][1] if blocks else pos
+        return AlignedRead(data[32:31 + l_name].decode('utf-8'),
+                           self.references[refid], pos, end, flag, mapq,
+                           blocks)
+
+    def fetch(self, chrom, sta, end):
+        '''
+        bam.fetch(chrom, sta, end) -> generator of AlignedRead
+        Reads overlapping [sta, end) on chrom, in coordinate order.
+        '''
+        if chrom not in self._refid:
+            return
+        rid = self._refid[chrom]
+        for beg, stop in self.index.chunks(rid, sta, end):
+            self._bgzf.seek(beg)
+            for record in self._records():
+                refid, pos, flag = record[0], record[1], record[6]
+                if refid != rid or pos >= end:
+                    break
+                if not flag & 4:
+                    read = self._read(*record)
+                    if read.end > sta:
+                        yield read
+                if self._bgzf.tell() >= stop:
+                    break
+
+    def fetch_blocks(self, chrom, sta, end):
+        '''
+        bam.fetch_blocks(chrom, sta, end) -> interval
+        Blocks of all the reads overlapping [sta, end) on chrom, the same
+        as extending readsplit results of `samtools view` lines.
+        '''
+        tmp = []
+        for read in self.fetch(chrom, sta, end):
+            tmp.extend(read.blocks)
+        return tmp
+
+    def __iter__(self):
+        self._bgzf.seek(self._data)
+        for record in self._records():
+            if record[0] < 0:
+                return
+            if not record[6] & 4:
+                yield self._read(*record)
+
+    def close(self):
+        self._bgzf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @classmethod
+    def indexpath(cls, path):
+        for i in (path + '.bai', os.path.splitext(path)[0] + '.bai'):
+            if os.path.exists(i):
+                return i
+        raise FileNotFoundError('Error: no BAI index for {}'.format(path))
+
+
+class BamPool:
+    '''
+    Class: BamPool
+
+    Usage: pool = BamPool(size=8)
+           with pool.open(path) as bam:
+    Notes: keep BAM handles open between region queries. Each handle is used
+           by one caller at a time (threads are safe), at most 'size' idle
+           handles are kept, and the BAI index of a path is parsed once and
+           shared by all of its handles.
+
+    Functions: pool.open(path), pool.close()
+    '''
+    def __init__(self, size=8):
+        self.size = size
+        self._idle = OrderedDict()
+        self._index = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def open(self, path):
+        bam = None
+        with self._lock:
+            if self._idle.get(path):
+                bam = self._idle[path].pop()
+            index = self._index.get(path)
+        if bam is None:
+            bam = BamFile(path, index)
+        try:
+            yield bam
+        finally:
+            with self._lock:
+                if bam._index is not None:
+                    self._index[path] = bam._index
+                self._idle.setdefault(path, []).append(bam)
+                self._idle.move_to_end(path)
+                while sum(len(i) for i in self._idle.values()) > self.size:
+                    old = next(iter(self._idle))
+                    self._idle[old].pop(0).close()
+                    if not self._idle[old]:
+                        del self._idle[old]
+
+    def close(self):
+        with self._lock:
+            for handles in self._idle.values():
+                for bam in handles:
+                    bam.close()
+            self._idle.clear()
+
+
+def writebam(path, references, reads):
+    '''
+    writebam(path, references, reads)
+    Write a small BAM file and its BAI index (path + '.bai') with
+    BGZFWriter, for tests and fixtures. references is [(name, length), ...]
+    and reads is [(name, chrom, pos, cigar, flag, mapq), ...] sorted by
+    reference and position, cigar is a string such as '10M100N20M'.
+    '''
+    refid = {name: n for n, (name, length) in enumerate(references)}
+    bins = [{} for i in references]
+    linear = [{} for i in references]
+    counts = [[0, 0] for i in references]
+    out = BGZFWriter(open(path, 'wb'))
+    text = b''.join(b'@SQ\tSN:' + name.encode() + b'\tLN:' +
+                    str(length).encode() + b'\n'
+                    for name, length in references)
+    out.write(b'BAM\x01' + _INT.pack(len(text)) + text +
+              _INT.pack(len(references)))
+    for name, length in references:
+        out.write(_INT.pack(len(name) + 1) + name.encode() + b'\x00' +
+                  _INT.pack(length))
+    out.flush()
+    for name, chrom, pos, cigar, flag, mapq in reads:
+        rid = refid[chrom]
+        ops = [int(n) << 4 | 'MIDNSHP=X'.index(op)
+               for n, op in _CIGAR.findall(cigar)]
+        end = pos + sum(i >> 4 for i in ops if i & 0xf in (0, 2, 3, 7, 8))
+        end = end if end > pos else pos + 1
+        bin_id = _reg2bin(pos, end)
+        data = (_RECORD.pack(rid, pos, len(name) + 1, mapq, bin_id, len(ops),
+                             flag, 0, -1, -1, 0) +
+                name.encode() + b'\x00' + struct.pack('<{}I'.format(len(ops)),
+                                                      *ops))
+        beg = out.tell()
+        out.write(_INT.pack(len(data)) + data)
+        stop = out.tell()
+        chunks = bins[rid].setdefault(bin_id, [])
+        if chunks and chunks[-1][1] == beg:
+            chunks[-1][1] = stop
+        else:
+            chunks.append([beg, stop])
+        for i in range(pos >> 14, ((end - 1) >> 14) + 1):
+            linear[rid].setdefault(i, beg)
+        counts[rid][1 if flag & 4 else 0] += 1
+    out.close()
+    tmp = [b'BAI\x01', _INT.pack(len(references))]
+    for rid in range(len(references)):
+        tmp.append(_INT.pack(len(bins[rid]) + 1))
+        for bin_id, chunks in sorted(bins[rid].items()):
+            tmp.append(struct.pack('<Ii', bin_id, len(chunks)))
+            tmp.extend(struct.pack('<QQ', *i) for i in chunks)
+        offsets = [i for chunks in bins[rid].values() for i in chunks]
+        first = min((i[0] for i in offsets), default=0)
+        last = max((i[1] for i in offsets), default=0)
+        tmp.append(struct.pack('<IiQQQQ', _METADATA_BIN, 2, first, last,
+                               *counts[rid]))
+        n_intv = max(linear[rid], default=-1) + 1
+        tmp.append(_INT.pack(n_intv))
+        tmp.append(struct.pack('<{}Q'.format(n_intv),
+                               *(linear[rid].get(i, 0) for i in range(n_intv))))
+    with open(path + '.bai', 'wb') as f:
+        f.write(b''.join(tmp))
+
+
+def _reg2bin(sta, end):
+    end -= 1
+    for shift, offset in ((14, 4681), (17, 585), (20, 73), (23, 9), (26, 1)):
+        if sta >> shift == end >> shift:
+            return offset + (sta >> shift)
+    return 0
+
+
+def _reg2bins(sta, end):
+    end -= 1
+    bins = [0]
+    for shift, offset in ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)):
+        bins.extend(range(offset + (sta >> shift), offset + (end >> shift) + 1))
+    return bins
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) == 3:
+        chrom, region = sys.argv[2].rsplit(':', 1)
+        sta, end = (int(i) for i in region.split('-'))
+        with BamFile(sys.argv[1]) as bam:
+            for read in bam.fetch(chrom, sta, end):
+                print(read.name, read.chrom, read.pos, read.end, read.blocks,
+                      sep='\t')
+        sys.exit(0)
+    # testing codes: write a BAM with writebam and compare fetch with brute
+    # force (run as bam.py *.bam chrom:sta-end to query a real BAM)
+    import gzip
+    import random
+    import tempfile
+    print('testing codes:')
+    random.seed(0)
+    references = [('chr1', 2000000), ('chr2', 300000), ('chr3', 1000)]
+    reads = []
+    for chrom, length in references[:2]:
+        for pos in sorted(random.randrange(length - 200000)
+                          for i in range(3000)):
+            a, b = random.randint(1, 100), random.randint(1, 100)
+            cigar = random.choice(['{}M'.format(a),
+                                   '{}M{}N{}M'.format(a, random.randint(1, 200000), b),
+                                   '5S{}M2I{}M3D{}M'.format(a, b, a)])
+            flag = random.choice([0, 16, 0, 4])
+            reads.append(('read{}_{}'.format(len(reads), 'x' * 30), chrom,
+                          pos, cigar, flag, 255))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'test.bam')
+        writebam(path, references, reads)
+        with gzip.open(path) as f:
+            assert f.read(4) == b'BAM\x01'
+        with BamFile(path) as bam:
+            assert bam.references == [i[0] for i in references]
+            assert bam.mapped == sum(1 for i in reads if not i[4] & 4)
+            assert [read.name for read in bam] == [i[0] for i in reads
+                                                   if not i[4] & 4]
+            spans = [(name, chrom, pos, pos + sum(
+                int(n) for n, op in _CIGAR.findall(cigar) if op in 'MDN=X'))
+                for name, chrom, pos, cigar, flag, mapq in reads
+                if not flag & 4]
+            for n in range(300):
+                chrom, length = random.choice(references)
+                sta = random.randrange(length)
+                end = sta + random.randint(1, 50000)
+                hits = [i[0] for i in spans
+                        if i[1] == chrom and i[2] < end and i[3] > sta]
+                assert [read.name for read in bam.fetch(chrom, sta, end)] == hits
+    print('writebam and BamFile.fetch are the same as brute force')
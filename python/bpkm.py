@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+'''
+bpkm.py - Calculate BPKM.
+author: Xiao-Ou Zhang
+version: 0.1.0
+'''
+
+import asyncio
+import atexit
+import os
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import groupby
+from bam import AlignedRead, BamFile, BamPool
+from cigar import readsplit
+from interval import Interval
+from map import sortedblocks
+from writer import ResultWriter
+
+_pool = BamPool(size=4)
+atexit.register(_pool.close)
+
+
+def readbed(f):
+    '''
+    readbed(f) -> [[chrom, sta, end, remaining...], ...]
+    Read BED lines, coordinates are converted to int.
+    '''
+    bed = []
+    for line in f:
+        chrom, sta, end, *remaining = line.split()
+        bed.append([chrom, int(sta), int(end)] + remaining)
+    return bed
+
+
+def readisoform(f):
+    '''
+    readisoform(f) -> [[chrom, exon_sta, exon_end, line], ...]
+    Read transcript lines with the chromosome in column 2 and the
+    comma-separated exon starts and ends in columns 7 and 8.
+    '''
+    isoform = []
+    for line in f:
+        col = line.split()
+        exon_sta = [int(i) for i in col[6].split(',') if i]
+        exon_end = [int(i) for i in col[7].split(',') if i]
+        isoform.append([col[1], exon_sta, exon_end, line.rstrip()])
+    return isoform
+
+
+def samreads(f):
+    '''
+    samreads(f) -> generator of AlignedRead
+    Read mapped reads from SAM lines, positions become 0-based like BAM.
+    '''
+    for line in f:
+        if line.startswith('@'):
+            continue
+        name, flag, chrom, pos, mapq, cigar = line.split('\t', 6)[:6]
+        if int(flag) & 4 or chrom == '*':
+            continue
+        blocks = readsplit(int(pos) - 1, cigar)
+        end = blocks[-1][1] if blocks else int(pos) - 1
+        yield AlignedRead(name, chrom, int(pos) - 1, end, int(flag),
+                          int(mapq), blocks)
+
+
+def countbases(bed, reads):
+    '''
+    countbases(bed, reads) -> array of bases
+    Sweep coordinate-sorted reads and the BED features together once and
+    count the read bases falling in every feature (in BED order).
+    '''
+    base = array('q', bytes(8 * len(bed)))
+    feature = {}
+    for n, i in enumerate(bed):
+        feature.setdefault(i[0], []).append(n)
+    done = set()
+    for chrom, chrom_reads in groupby(reads, key=lambda i: i.chrom):
+        assert chrom not in done, 'Error: the reads are not sorted by coordinate'
+        done.add(chrom)
+        if chrom not in feature:
+            continue
+        index = sorted(feature[chrom], key=lambda n: bed[n][1])
+        f_sta = [bed[n][1] for n in index]
+        f_end = [bed[n][2] for n in index]
+        active = []
+        p = 0
+        blocks = sortedblocks(i.blocks for i in chrom_reads)
+        for block_sta, block_end in blocks:
+            while p < len(index) and f_sta[p] < block_end:
+                active.append(p)
+                p += 1
+            tmp = []
+            for k in active:
+                if f_end[k] <= block_sta:
+                    continue
+                tmp.append(k)
+                sta = f_sta[k] if f_sta[k] > block_sta else block_sta
+                end = f_end[k] if f_end[k] < block_end else block_end
+                if sta < end:
+                    base[index[k]] += end - sta
+            active = tmp
+    return base
+
+
+def calculatebpkm(bed, reads, total, length):
+    '''
+    calculatebpkm(bed, reads, total, length) -> [bpkm, ...]
+    Calculate BPKM of every BED feature with a single pass over
+    coordinate-sorted reads.
+    '''
+    return tobpkm(bed, countbases(bed, reads), total, length)
+
+
+def parallelbpkm(bed, bam, length, processes=None, binsize=None):
+    '''
+    parallelbpkm(bed, bam, length, processes, binsize) -> [bpkm, ...]
+    Calculate BPKM with a pool of processes. Features are sharded by
+    chromosome, and into bins of binsize bases if binsize is given, every
+    worker fetches the reads of its shard with its own BAM handles (kept in
+    a small BamPool between shards), and the results are returned in BED
+    order whatever order the shards finish in.
+    '''
+    shards = _shards(bed, binsize)
+    base = array('q', bytes(8 * len(bed)))
+    with BamFile(bam) as f:
+        total = f.mapped
+    with ProcessPoolExecutor(processes) as executor:
+        tasks = [executor.submit(_countshard, bam, [bed[n][:3] for n in ids])
+                 for key, ids in shards]
+        for (key, ids), task in zip(shards, tasks):
+            for n, count in zip(ids, task.result()):
+                base[n] = count
+    return tobpkm(bed, base, total, length)
+
+
+def multibpkm(bed, bams, length, window=8, binsize=None):
+    '''
+    multibpkm(bed, bams, length, window=8, binsize=None) -> [[bpkm, ...], ...]
+    Calculate BPKM of every BED feature in every BAM file in one run, as a
+    features x samples matrix (one row per feature, in BED order). See
+    multicount for the scheduling.
+    '''
+    total, base = asyncio.run(multicount(bed, bams, window, binsize))
+    bpkm = [tobpkm(bed, i, j, length) for i, j in zip(base, total)]
+    return [list(i) for i in zip(*bpkm)]
+
+
+async def multicount(bed, bams, window=8, binsize=None):
+    '''
+    multicount(bed, bams, window=8, binsize=None) -> (total, base)
+    Coroutine counting the bases of the BED features in many BAM files.
+    The features are sharded once (as parallelbpkm does) and shared by all
+    the BAM files, and every (BAM, shard) region is fetched in a pool of
+    threads through a BamPool, so that the decompression of several files
+    overlaps. At most window regions are in flight at a time. total[k] is
+    the number of mapped reads and base[k] the array of bases of bams[k].
+    '''
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(window)
+    pool = BamPool(size=window)
+    shards = [(ids, [bed[n][:3] for n in ids])
+              for key, ids in _shards(bed, binsize)]
+    base = [array('q', bytes(8 * len(bed))) for bam in bams]
+
+    def mapped(bam):
+        with pool.open(bam) as f:
+            return f.mapped
+
+    def count(bam, shard):
+        with pool.open(bam) as f:
+            return _countregion(f, shard)
+
+    async def run(func, *args):
+        async with semaphore:
+            return await loop.run_in_executor(executor, func, *args)
+
+    async def region(k, ids, shard):
+        for n, i in zip(ids, await run(count, bams[k], shard)):
+            base[k][n] = i
+
+    try:
+        with ThreadPoolExecutor(window) as executor:
+            total = await asyncio.gather(*(run(mapped, i) for i in bams))
+            await asyncio.gather(*(region(k, ids, shard)
+                                   for k in range(len(bams))
+                                   for ids, shard in shards))
+    finally:
+        pool.close()
+    return total, base
+
+
+def _shards(bed, binsize):
+    shards = {}
+    for n, i in enumerate(bed):
+        key = (i[0], i[1] // binsize) if binsize else (i[0], 0)
+        shards.setdefault(key, []).append(n)
+    return sorted(shards.items())
+
+
+def _countshard(bam, bed):
+    with _pool.open(bam) as f:
+        return _countregion(f, bed)
+
+
+def _countregion(bam, bed):
+    sta = min(i[1] for i in bed)
+    end = max(i[2] for i in bed)
+    if sta >= end:
+        return array('q', bytes(8 * len(bed)))
+    return countbases(bed, bam.fetch(bed[0][0], sta, end))
+
+
+def isoformbpkm(isoform, bam, total, length):
+    '''
+    isoformbpkm(isoform, bam, total, length) -> [bpkm, ...]
+    Calculate BPKM of transcripts made of several exons. Transcripts are
+    grouped into loci of overlapping spans, the reads of every locus are
+    fetched once and their blocks are shared by all the isoforms of the
+    locus, whose exons are held as an Interval.
+    '''
+    tmp = [0] * len(isoform)
+    span = {}
+    for n, i in enumerate(isoform):
+        if i[1]:
+            span.setdefault(i[0], []).append([min(i[1]), max(i[2]), n])
+    for chrom in span:
+        for locus in Interval(span[chrom]):
+            block_sta, block_end = array('q'), array('q')
+            for read in bam.fetch(chrom, locus[0], locus[1]):
+                for sta, end in read.blocks:
+                    block_sta.append(sta)
+                    block_end.append(end)
+            if not block_sta:
+                continue
+            for n in locus[2:]:
+                exon_sta, exon_end = isoform[n][1:3]
+                exon = Interval([list(i) for i in zip(exon_sta, exon_end)])
+                base = sum(exon.query_batch(block_sta, block_end)[1])
+                isoform_length = sum(exon_end) - sum(exon_sta)
+                if base and isoform_length:
+                    tmp[n] = (base * pow(10, 9) /
+                              (total * length * isoform_length))
+    return tmp
+
+
+def tobpkm(bed, base, total, length):
+    '''
+    tobpkm(bed, base, total, length) -> [bpkm, ...]
+    Convert the bases counted in every BED feature into BPKM.
+    '''
+    tmp = []
+    for i, count in zip(bed, base):
+        if not count or i[1] == i[2]:
+            tmp.append(0)
+        else:
+            tmp.append(count * pow(10, 9) / (total * length * (i[2] - i[1])))
+    return tmp
+
+
+def writebpkm(out, bed, bpkm):
+    '''
+    writebpkm(out, bed, bpkm)
+    Write results as "chrom:sta-end<TAB>bpkm<TAB>remaining..." with a
+    ResultWriter.
+    '''
+    out.extend(['{}:{}-{}'.format(*i[0:3]) for i in bed], bpkm,
+               [i[3:] for i in bed])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (4, 5):
+        print('bpkm.py *.bed/*.txt *.bam length [processes]')
+        print('bpkm.py *.bed *.bam,*.bam... length [window]')
+        print('processes: worker processes for one BAM (sharded by region)')
+        print('window: (BAM, region) fetches in flight for many BAMs')
+        sys.exit(0)
+    name = os.path.splitext(os.path.split(sys.argv[1])[1])[0]
+    length = int(sys.argv[3])
+    if ',' in sys.argv[2]:
+        bams = sys.argv[2].split(',')
+        with open(sys.argv[1], 'r') as f:
+            bed = readbed(f)
+        window = int(sys.argv[4]) if len(sys.argv) == 5 else 8
+        matrix = multibpkm(bed, bams, length, window, binsize=pow(10, 7))
+        with ResultWriter('{}.bpkm'.format(name)) as out:
+            out.write('#region',
+                      [os.path.splitext(os.path.split(i)[1])[0] for i in bams],
+                      [])
+            out.extend(['{}:{}-{}'.format(*i[0:3]) for i in bed], matrix,
+                       [i[3:] for i in bed])
+        sys.exit(0)
+    if not sys.argv[1].endswith('.bed'):
+        with open(sys.argv[1], 'r') as f:
+            isoform = readisoform(f)
+        with BamFile(sys.argv[2]) as bam:
+            bpkm = isoformbpkm(isoform, bam, bam.mapped, length)
+        with ResultWriter('{}.bpkm'.format(name)) as out:
+            out.extend([i[3] for i in isoform], bpkm)
+        sys.exit(0)
+    with open(sys.argv[1], 'r') as f:
+        bed = readbed(f)
+    if len(sys.argv) == 5:
+        bpkm = parallelbpkm(bed, sys.argv[2], length, int(sys.argv[4]),
+                            binsize=pow(10, 7))
+    else:
+        with BamFile(sys.argv[2]) as bam:
+            bpkm = calculatebpkm(bed, bam, bam.mapped, length)
+    with ResultWriter('{}.bpkm'.format(name)) as out:
+        writebpkm(out, bed, bpkm)
@@ -0,0 +1,205 @@
+'''
+cache.py - Cache interval indexes in binary files.
+author: Xiao-Ou Zhang
+version: 0.1.0
+'''
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from interval import ArrayInterval
+from map import MapIndex
+from nclist import NCList
+
+_MAGIC = b'ULCACHE\x01'
+_LENGTH = struct.Struct('<Q')
+
+
+def dump(path, table, source=None):
+    '''
+    dump(path, table, source=None)
+    Write {key: Interval/ArrayInterval/MapIndex} (keys are chromosomes or
+    (chrom, strand)) as flat int64 columns plus a table of the distinct
+    tags, which should be str or numbers. The size, mtime and checksum of
+    the source file are kept in the header. The file is written aside and
+    renamed into place, so readers never see a partial cache.
+    '''
+    tags, tagid = [], {}
+
+    def encode(values):
+        ids = array('q')
+        for i in values:
+            i = tuple(i)
+            if i not in tagid:
+                tagid[i] = len(tags)
+                tags.append(i)
+            ids.append(tagid[i])
+        return ids
+
+    entries, columns = [], []
+    offset = 0
+    for key, value in table.items():
+        if isinstance(value, MapIndex):
+            entry = {'kind': 'mapindex'}
+            cols = [('sta', value.sta), ('end', value.end),
+                    ('order', value.order), ('info', encode(value.info))]
+            if value.nclist is not None:
+                nc = value.nclist
+                entry['top'] = list(nc._top)
+                cols.extend([('nc_sta', nc.sta), ('nc_end', nc.end),
+                             ('nc_id', nc.id), ('nc_sub_sta', nc.sub_sta),
+                             ('nc_sub_end', nc.sub_end)])
+        else:
+            value = ArrayInterval.wrap(value)
+            entry = {'kind': 'interval'}
+            cols = [('starts', value.starts), ('ends', value.ends),
+                    ('tags', encode(value.tags))]
+        entry['key'] = key
+        entry['columns'] = {}
+        for name, col in cols:
+            entry['columns'][name] = [offset, len(col)]
+            columns.append(col)
+            offset += 8 * len(col)
+        entries.append(entry)
+    header = json.dumps({'byteorder': sys.byteorder,
+                         'source': _stamp(source, True) if source else None,
+                         'tags': tags, 'entries': entries}).encode()
+    header += b' ' * (-len(header) % 8)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(_LENGTH.pack(len(header)))
+            f.write(header)
+            for col in columns:
+                f.write(col)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load(path, source=None, verify=False):
+    '''
+    load(path, source=None, verify=False) -> {key: ArrayInterval/MapIndex}
+    Map a cache written by dump into memory. Coordinates are read-only
+    memoryviews on the mapped file, so nothing is copied and concurrent
+    jobs share the page-cached file (memoryviews cannot be pickled, so
+    worker processes should load the cache themselves). Interval entries
+    come back as ArrayInterval. Return None if there is no valid cache
+    (missing, truncated or corrupt), or if source is given and its size or
+    mtime (and checksum, with verify) have changed.
+    '''
+    try:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+    if mm[:len(_MAGIC)] != _MAGIC:
+        return None
+    n = len(_MAGIC) + _LENGTH.size
+    try:
+        size = _LENGTH.unpack_from(mm, len(_MAGIC))[0]
+        if len(mm) < n + size:
+            return None
+        header = json.loads(mm[n:n + size].decode())
+        if header['byteorder'] != sys.byteorder:
+            return None
+        stamp = header['source']
+        end = max((sta + 8 * length for entry in header['entries']
+                   for sta, length in entry['columns'].values()), default=0)
+    except (struct.error, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if len(mm) < n + size + end:
+        return None
+    if source is not None:
+        if type(stamp) is not list or _stamp(source, False) != stamp[:2]:
+            return None
+        if verify and stamp[2:3] != [_checksum(source)]:
+            return None
+    try:
+        return _table(header, memoryview(mm)[n + size:])
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def cached(source, build, path=None, verify=False):
+    '''
+    cached(source, build, path=None, verify=False) -> {key: ArrayInterval/MapIndex}
+    Load the cache of source (path defaults to source + '.cache'). If it is
+    missing or out of date, build(source) makes the table again, which is
+    dumped and then loaded.
+    '''
+    path = path or source + '.cache'
+    table = load(path, source, verify)
+    if table is None:
+        table = build(source)
+        dump(path, table, source)
+        return load(path, source) or table
+    return table
+
+
+def _table(header, data):
+    tags = list(map(tuple, header['tags']))
+    info = None
+    table = {}
+    for entry in header['entries']:
+        key = entry['key']
+        key = tuple(key) if type(key) is list else key
+        col = {name: data[sta:sta + 8 * length].cast('q')
+               for name, (sta, length) in entry['columns'].items()}
+        if entry['kind'] == 'mapindex':
+            obj = MapIndex.__new__(MapIndex)
+            obj.sta, obj.end, obj.order = col['sta'], col['end'], col['order']
+            if info is None:
+                info = list(map(list, tags))
+            obj.info = [info[i] for i in col['info']]
+            obj.nclist = None
+            if 'top' in entry:
+                nc = obj.nclist = NCList.__new__(NCList)
+                nc.sta, nc.end, nc.id = col['nc_sta'], col['nc_end'], col['nc_id']
+                nc.sub_sta, nc.sub_end = col['nc_sub_sta'], col['nc_sub_end']
+                nc._top = tuple(entry['top'])
+                nc.info = None
+        else:
+            obj = ArrayInterval.__new__(ArrayInterval)
+            obj.starts, obj.ends = col['starts'], col['ends']
+            obj.tags = [tags[i] for i in col['tags']]
+        table[key] = obj
+    return table
+
+
+def _stamp(source, checksum):
+    stat = os.stat(source)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    if checksum:
+        stamp.append(_checksum(source))
+    return stamp
+
+
+def _checksum(source):
+    tmp = hashlib.sha1()
+    with open(source, 'rb') as f:
+        for data in iter(lambda: f.read(1 << 20), b''):
+            tmp.update(data)
+    return tmp.hexdigest()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('cache.py *.bed[.gz]')
+        sys.exit(0)
+    from loader import loadbed
+
+    def build(path):
+        return {key: value.arrayinterval()
+                for key, value in loadbed(path).items()}
+    table = cached(sys.argv[1], build)
+    for key in sorted(table):
+        print(key, len(table[key]), sep='\t')
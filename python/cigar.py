@@ -0,0 +1,92 @@
+'''
+cigar.py - Deal with CIGAR strings.
+author: Xiao-Ou Zhang
+version: 0.1.0
+'''
+
+import re
+import sys
+from array import array
+from functools import lru_cache
+
+_OPERATION = re.compile(r'(\d+)([MIDNSHP=X])')
+_CIGAR = re.compile(r'(?:\d+[MIDNSHP=X])+')
+
+
+@lru_cache(maxsize=4096)
+def parse(cigar):
+    '''
+    parse(cigar) -> ((sta, end), ...)
+    Split cigar into aligned blocks relative to the read position.
+    M/=/X/D extend the current block, N starts a new one, I/S/H/P do not
+    consume the reference. Results are cached on the cigar string, as most
+    reads share a few dozen cigars.
+    '''
+    if cigar == '*':
+        return ()
+    assert _CIGAR.fullmatch(cigar), 'Error: the cigar {} is illegal'.format(cigar)
+    blocks = []
+    sta = end = 0
+    for num, op in _OPERATION.findall(cigar):
+        if op in 'M=XD':
+            end += int(num)
+        elif op == 'N':
+            if end > sta:
+                blocks.append((sta, end))
+            sta = end = end + int(num)
+    if end > sta:
+        blocks.append((sta, end))
+    return tuple(blocks)
+
+
+def readsplit(pos, cigar):
+    '''
+    readsplit(pos, cigar) -> interval
+    Split reads.
+    '''
+    pos = int(pos)
+    return [[pos + sta, pos + end] for sta, end in parse(cigar)]
+
+
+def readsplit_batch(pos, cigar):
+    '''
+    readsplit_batch(pos, cigar) -> (sta, end, read_id)
+    Split many reads at once, the blocks are returned as three arrays,
+    read_id is the position of the read in pos/cigar.
+    '''
+    sta, end, read_id = array('q'), array('q'), array('q')
+    for n, p, c in zip(range(len(pos)), pos, cigar):
+        p = int(p)
+        for a, b in parse(c):
+            sta.append(p + a)
+            end.append(p + b)
+            read_id.append(n)
+    return sta, end, read_id
+
+
+@lru_cache(maxsize=4096)
+def parse_bam(cigar):
+    '''
+    parse_bam(cigar) -> ((sta, end), ...)
+    The same as parse, but for the binary cigar of BAM records (a bytes
+    object of little-endian uint32 op_len << 4 | op), cached on the bytes.
+    '''
+    blocks = []
+    sta = end = 0
+    for i in array('I', cigar) if sys.byteorder == 'little' else _swap(cigar):
+        op = i & 0xf
+        if op in (0, 2, 7, 8):
+            end += i >> 4
+        elif op == 3:
+            if end > sta:
+                blocks.append((sta, end))
+            sta = end = end + (i >> 4)
+    if end > sta:
+        blocks.append((sta, end))
+    return tuple(blocks)
+
+
+def _swap(cigar):
+    tmp = array('I', cigar)
+    tmp.byteswap()
+    return tmp
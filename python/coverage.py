@@ -0,0 +1,188 @@
+'''
+coverage.py - Deal with per-base coverage.
+author: Xiao-Ou Zhang
+version: 0.1.0
+'''
+
+from array import array
+from bisect import bisect_left, bisect_right
+from interval import Interval
+
+
+class Coverage:
+    '''
+    Class: Coverage
+
+    Maintainer: Xiao-Ou Zhang
+
+    Version: 0.1.0
+
+    Requirements: Python 3.X
+
+    Usage: cov = Coverage(list) or cov = Coverage(Interval)
+           (nested list: [[x,x,f1...],[x,x,f2...]...] / [[x,x],[x,x]...])
+    Notes: unlike Interval, overlapping blocks are not merged but stacked.
+           Blocks are accumulated in a difference array (position -> depth
+           change), which is turned into a run-length encoded depth track
+           on the first query: depth[n] holds on [pos[n], pos[n + 1]).
+
+    For example: input:  [[1, 10], [5, 12], [20, 25]]
+                 output: pos:   [1, 5, 10, 12, 20, 25]
+                         depth: [1, 2, 1, 0, 1, 0]
+
+    Attributes: pos, depth
+
+    Functions: cov.add(sta, end, depth)
+               cov.add_blocks(starts, ends)
+               cov += b
+               cov.sum(sta, end)
+               cov.mean(sta, end)
+               cov.max(sta, end)
+               cov.threshold(mindepth)
+               cov.mask(interval)
+    '''
+    def __init__(self, interval=None):
+        self._diff = {}
+        self._track = None
+        if interval is not None:
+            self += interval
+
+    def add(self, sta, end, depth=1):
+        '''
+        Usage: cov.add(sta, end, depth)
+        add depth to [sta, end].
+        '''
+        if sta >= end:
+            return
+        self._diff[sta] = self._diff.get(sta, 0) + depth
+        self._diff[end] = self._diff.get(end, 0) - depth
+        self._track = None
+
+    def add_blocks(self, starts, ends):
+        '''
+        Usage: cov.add_blocks(starts, ends)
+        add a batch of blocks, such as the columns of readsplit_batch.
+        '''
+        diff = self._diff
+        for sta, end in zip(starts, ends):
+            if sta < end:
+                diff[sta] = diff.get(sta, 0) + 1
+                diff[end] = diff.get(end, 0) - 1
+        self._track = None
+
+    def __iadd__(self, interval):
+        '''
+        Usage: cov += b
+        add blocks of 'b' (list or Interval).
+        '''
+        if isinstance(interval, Interval):
+            interval = interval.interval
+        for i in Interval.convert(interval):
+            self.add(int(i[0]), int(i[1]))
+        return self
+
+    def _build(self):
+        if self._track is None:
+            pos, depth, area = array('q'), array('q'), array('q')
+            a, s, last = 0, 0, 0
+            for i in sorted(self._diff):
+                s += a * (i - last)
+                last = i
+                if not self._diff[i]:
+                    continue
+                a += self._diff[i]
+                if depth and depth[-1] == a:
+                    continue
+                pos.append(i)
+                depth.append(a)
+                area.append(s)
+            self._track = pos, depth, area
+        return self._track
+
+    @property
+    def pos(self):
+        return self._build()[0]
+
+    @property
+    def depth(self):
+        return self._build()[1]
+
+    def _area(self, x):
+        pos, depth, area = self._build()
+        n = bisect_right(pos, x) - 1
+        if n < 0:
+            return 0
+        return area[n] + depth[n] * (x - pos[n])
+
+    def sum(self, sta, end):
+        '''
+        Usage: cov.sum(sta, end)
+        covered bases (depth summed over every base) in [sta, end].
+        '''
+        if sta >= end:
+            return 0
+        return self._area(end) - self._area(sta)
+
+    def mean(self, sta, end):
+        '''
+        Usage: cov.mean(sta, end)
+        mean depth in [sta, end].
+        '''
+        if sta >= end:
+            return 0
+        return self.sum(sta, end) / (end - sta)
+
+    def max(self, sta, end):
+        '''
+        Usage: cov.max(sta, end)
+        max depth in [sta, end].
+        '''
+        pos, depth, area = self._build()
+        if sta >= end:
+            return 0
+        i = max(bisect_right(pos, sta) - 1, 0)
+        j = bisect_left(pos, end)
+        return max(depth[i:j], default=0)
+
+    def threshold(self, mindepth=1):
+        '''
+        Usage: cov.threshold(mindepth)
+        regions with depth >= mindepth, as an Interval.
+        '''
+        pos, depth, area = self._build()
+        tmp = []
+        for n in range(len(pos) - 1):
+            if depth[n] >= mindepth:
+                if tmp and tmp[-1][1] == pos[n]:
+                    tmp[-1][1] = pos[n + 1]
+                else:
+                    tmp.append([pos[n], pos[n + 1]])
+        return Interval.fromsorted(tmp)
+
+    def mask(self, interval):
+        '''
+        Usage: cov.mask(b)
+        coverage inside 'b' (list or Interval) only, as a new Coverage.
+        '''
+        pos, depth, area = self._build()
+        if not isinstance(interval, Interval):
+            interval = Interval(interval)
+        tmp = Coverage()
+        for i in interval.interval:
+            n = max(bisect_right(pos, i[0]) - 1, 0)
+            while n < len(pos) and pos[n] < i[1]:
+                sta = pos[n] if pos[n] > i[0] else i[0]
+                end = pos[n + 1] if n + 1 < len(pos) else i[1]
+                end = end if end < i[1] else i[1]
+                if depth[n]:
+                    tmp.add(sta, end, depth[n])
+                n += 1
+        return tmp
+
+    def __repr__(self):
+        '''
+        print objects.
+        '''
+        pos, depth, area = self._build()
+        return repr([[pos[n], pos[n + 1], depth[n]]
+                     for n in range(len(pos) - 1) if depth[n]])
@@ -0,0 +1,203 @@
+'''
+genome.py - Deal with genome-wide intervals.
+author: Xiao-Ou Zhang
+version: 0.1.0
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from interval import ArrayInterval
+
+
+class GenomeIntervals:
+    '''
+    Class: GenomeIntervals
+
+    Maintainer: Xiao-Ou Zhang
+
+    Version: 0.1.0
+
+    Requirements: Python 3.X
+
+    Usage: g = GenomeIntervals(dict) or g = GenomeIntervals.frombed(path)
+           (dict: {(chrom, strand): nested list / Interval / ArrayInterval})
+    Notes: one ArrayInterval is kept per (chrom, strand), strand is '+', '-'
+           or '.'. Set operations work key by key, in worker processes if
+           'processes' is given. A key may also be given a zero-argument
+           function which is only called (and its result cached) the first
+           time the key is used, so that chromosomes are loaded lazily.
+           Set operations load such keys one at a time where they are
+           computed (in the workers with 'processes', so the functions
+           should be picklable, as those of frombed are) without caching
+           them.
+
+    Attributes: keys()
+
+    Functions: c = a + b, a.union(b, processes)
+               c = a * b, a.intersect(b, processes)
+               c = a - b, a.difference(b, processes)
+               a[chrom, strand]
+               a.unstranded()
+               GenomeIntervals.frombed(path, stranded, lazy)
+    '''
+    def __init__(self, interval=None):
+        self._interval = {}
+        self._loader = {}
+        for key, value in (interval or {}).items():
+            if callable(value):
+                self._loader[key] = value
+            else:
+                self._interval[key] = ArrayInterval.wrap(value)
+
+    def keys(self):
+        return sorted(set(self._interval) | set(self._loader))
+
+    def __getitem__(self, key):
+        '''
+        Usage: a[chrom, strand]
+        intervals of (chrom, strand), loaded if needed.
+        '''
+        if key not in self._interval:
+            if key in self._loader:
+                value = self._loader.pop(key)()
+                self._interval[key] = ArrayInterval.wrap(value)
+            else:
+                return ArrayInterval([])
+        return self._interval[key]
+
+    def __contains__(self, key):
+        return key in self._interval or key in self._loader
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        '''
+        print objects.
+        '''
+        return repr({key: self[key] for key in self.keys()})
+
+    def _entry(self, key):
+        if key in self._interval:
+            return self._interval[key]
+        return self._loader.get(key)
+
+    def _operate(self, other, op, keys, processes):
+        pairs = ((self._entry(key), other._entry(key)) for key in keys)
+        if processes:
+            with ProcessPoolExecutor(processes) as executor:
+                result = list(executor.map(partial(_apply, op), pairs,
+                                           chunksize=8))
+        else:
+            result = [_apply(op, pair) for pair in pairs]
+        return GenomeIntervals(dict(zip(keys, result)))
+
+    def union(self, other, processes=None):
+        '''
+        Usage: c = a.union(b, processes)
+        genome-wide union intervals.
+        '''
+        other = GenomeIntervals.wrap(other)
+        keys = sorted(set(self.keys()) | set(other.keys()))
+        return self._operate(other, '+', keys, processes)
+
+    def intersect(self, other, processes=None):
+        '''
+        Usage: c = a.intersect(b, processes)
+        genome-wide intersection intervals.
+        '''
+        other = GenomeIntervals.wrap(other)
+        keys = sorted(set(self.keys()) & set(other.keys()))
+        return self._operate(other, '*', keys, processes)
+
+    def difference(self, other, processes=None):
+        '''
+        Usage: c = a.difference(b, processes)
+        genome-wide difference intervals.
+        '''
+        other = GenomeIntervals.wrap(other)
+        return self._operate(other, '-', self.keys(), processes)
+
+    def __add__(self, other):
+        return self.union(other)
+
+    def __mul__(self, other):
+        return self.intersect(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def unstranded(self):
+        '''
+        Usage: a.unstranded()
+        merge the strands of every chromosome, strand becomes '.'.
+        '''
+        tmp = {}
+        for chrom, strand in self.keys():
+            if (chrom, '.') in tmp:
+                tmp[chrom, '.'] = tmp[chrom, '.'] + self[chrom, strand]
+            else:
+                tmp[chrom, '.'] = self[chrom, strand]
+        return GenomeIntervals(tmp)
+
+    @classmethod
+    def wrap(cls, interval):
+        '''
+        return 'interval' as a GenomeIntervals, without copying if it is
+        already one.
+        '''
+        if isinstance(interval, GenomeIntervals):
+            return interval
+        return cls(interval)
+
+    @classmethod
+    def frombed(cls, path, stranded=True, lazy=False):
+        '''
+        GenomeIntervals.frombed(path, stranded, lazy) -> GenomeIntervals
+        Read a BED file, the name column (if any) becomes the tag. With
+        lazy, the file is only scanned for line offsets of every key and
+        a chromosome is parsed the first time it is used.
+        '''
+        tmp = {}
+        n = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                col = line.split(None, 6)
+                if col and not line.startswith((b'#', b'track', b'browser')):
+                    strand = col[5].decode() if stranded and len(col) > 5 else '.'
+                    key = col[0].decode(), strand
+                    if lazy:
+                        tmp.setdefault(key, []).append(n)
+                    else:
+                        tmp.setdefault(key, []).append(_bedrow(col))
+                n += len(line)
+        if lazy:
+            return cls({key: partial(_readbed, path, value)
+                        for key, value in tmp.items()})
+        return cls(tmp)
+
+
+def _apply(op, pair):
+    a, b = (ArrayInterval([]) if i is None else
+            ArrayInterval.wrap(i() if callable(i) else i) for i in pair)
+    if op == '+':
+        return a + b
+    elif op == '*':
+        return a * b
+    else:
+        return a - b
+
+
+def _readbed(path, offset):
+    tmp = []
+    with open(path, 'rb') as f:
+        for n in offset:
+            f.seek(n)
+            tmp.append(_bedrow(f.readline().split(None, 4)))
+    return tmp
+
+
+def _bedrow(col):
+    if len(col) > 3:
+        return [int(col[1]), int(col[2]), col[3].decode()]
+    return [int(col[1]), int(col[2])]
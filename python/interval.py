@@ -3,11 +3,17 @@
 '''
 interval.py - Deal with intervals.
 author: Xiao-Ou Zhang
-version: 0.7.0
+version: 0.8.0
 requirements: Python 3.X
 '''
 
 import copy
+import heapq
+from collections import deque
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, compress, count, repeat
+from operator import eq, itemgetter, lt, sub
 
 
 class Interval:
@@ -16,7 +22,7 @@ class Interval:
 
     Maintainer: Xiao-Ou Zhang
 
-    Version: 0.7.0
+    Version: 0.8.0
 
     Requirements: Python 3.X (for Python 2.0, some bugs may occur)
 
@@ -25,6 +31,16 @@ class Interval:
             simple list: [x,x,f1...] / [x,x])
     Notes: all the intervals in the list will become mutually exclusive and
            be sorted after instantiation.
+           Instances are copy-on-write: the operators never modify their
+           operands, and their results share unchanged intervals (and all
+           the tags) with them instead of deep-copying. complement,
+           extractwith and extractwithout rebind a.interval rather than
+           editing it, so a + b - c allocates only the intervals it
+           creates. Use a.copy() before editing a.interval[n] in place.
+           The query functions (overlaps, find, contains_point, query_batch
+           and 'in') binary search the sorted intervals instead of intersecting.
+           union_all, intersect_all and atleast combine many instances with
+           one k-way heap merge, in O(N log k) instead of k - 1 operators.
 
     For example: input:  [[1, 10, 'a'], [17, 22, 'b'], [7, 12, 'c'], [20, 25, 'd'], [30, 35, 'e']]
                  output: [[1, 12, 'a', 'c'], [17, 25, 'b', 'd'], [30, 35, 'e']]
@@ -42,14 +58,25 @@ class Interval:
                a.complement(sta, end)
                a.extractwith(b)
                a.extractwithout(b)
+               a.copy()
+               a.overlaps(sta, end)
+               a.find(sta, end)
+               a.contains_point(pos)
+               a.query_batch(starts, ends)
+               a.lazy()
+               Interval.union_all(sets)
+               Interval.intersect_all(sets)
+               Interval.atleast(sets, k)
     '''
+    sort_threshold = 1024
+
     def __init__(self, interval, instance_flag=0):
         self.interval = [[int(i[0]), int(i[1])] + i[2:]
                          for i in Interval.convert(interval)]
         if not self.interval:
             return
         if not instance_flag:
-            self.interval.sort()
+            Interval.sort(self.interval)
             tmp = []
             a = self.interval[0]
             for b in self.interval[1:]:
@@ -67,12 +94,14 @@ class Interval:
         Usage: c = a + b or a += b
         extract union intervals, 'a' should be instance.
         '''
-        tmp = copy.deepcopy(self.interval)
         if isinstance(interval, Interval):
-            tmp.extend(interval.interval)
+            tmp = interval.interval
         else:
-            tmp.extend(Interval.convert(interval))
-        return Interval(tmp)
+            tmp = [[int(i[0]), int(i[1])] + i[2:]
+                   for i in Interval.convert(interval)]
+            Interval.sort(tmp)
+        tmp = heapq.merge(self.interval, tmp)
+        return Interval.fromsorted(Interval.coalesce(tmp))
 
     def __radd__(self, interval):
         '''
@@ -86,35 +115,12 @@ class Interval:
         Usage: c = a * b or a *= b
         extract intersection intervals, 'a' should be instance.
         '''
-        tmp = []
-        tmp1 = self.interval
         if isinstance(interval, Interval):
-            tmp2 = interval.interval
+            tmp = interval.interval
         else:
-            tmp2 = Interval(interval).interval
-        if not tmp1 or not tmp2:
-            return Interval([])
-        a, b = tmp1[0], tmp2[0]
-        i, j = 1, 1
-        while True:
-            sta = a[0] if a[0] > b[0] else b[0]
-            end = a[1] if a[1] < b[1] else b[1]
-            if sta < end:
-                if real_flag:
-                    tmp.append([sta, end] + a[2:] + b[2:])
-                else:
-                    tmp.append(copy.copy(a))
-            if a[1] == end:
-                if i == len(tmp1):
-                    break
-                a = tmp1[i]
-                i += 1
-            if b[1] == end:
-                if j == len(tmp2):
-                    break
-                b = tmp2[j]
-                j += 1
-        return Interval(tmp, 1)
+            tmp = Interval(interval).interval
+        return Interval.fromsorted(list(_product(self.interval, tmp,
+                                                 real_flag)))
 
     def __rmul__(self, interval):
         '''
@@ -128,49 +134,19 @@ class Interval:
         Usage: c = a - b or a -= b
         extract difference intervals, 'a' should be instance.
         '''
-        if not self.interval:
-            return Interval([])
         if isinstance(interval, Interval):
-            tmp = copy.deepcopy(interval)
-        else:
-            tmp = Interval(interval)
-        if not tmp:
-            return copy.deepcopy(self)
-        if self.interval[0][0] < tmp.interval[0][0]:
-            sta = self.interval[0][0]
-        else:
-            sta = tmp.interval[0][0]
-        if self.interval[-1][1] > tmp.interval[-1][1]:
-            end = self.interval[-1][1]
+            tmp = interval.interval
         else:
-            end = tmp.interval[-1][1]
-        tmp.complement(sta, end)
-        return self.__mul__(tmp, real_flag)
+            tmp = Interval(interval).interval
+        return Interval.fromsorted(list(_difference(self.interval, tmp,
+                                                    real_flag)))
 
     def __rsub__(self, interval):
         '''
         Usage: c = b - a
         extract difference intervals, 'a' should be instance.
         '''
-        if isinstance(interval, Interval):
-            tmp = copy.deepcopy(interval)
-        else:
-            tmp = Interval(interval)
-        if not self.interval:
-            return tmp
-        if not tmp:
-            return Interval([])
-        if self.interval[0][0] < tmp.interval[0][0]:
-            sta = self.interval[0][0]
-        else:
-            sta = tmp.interval[0][0]
-        if self.interval[-1][1] > tmp.interval[-1][1]:
-            end = self.interval[-1][1]
-        else:
-            end = tmp.interval[-1][1]
-        tmp_a = copy.deepcopy(self)
-        tmp_a.complement(sta, end)
-        return Interval.__mul__(tmp, tmp_a)
+        return Interval(interval).__sub__(self)
 
     def __getitem__(self, index):
         '''
@@ -179,6 +155,13 @@ class Interval:
         '''
         return self.interval[index]
 
+    def copy(self):
+        '''
+        Usage: a.copy()
+        copy of 'a' which can be edited in place, tags are not copied.
+        '''
+        return Interval.fromsorted([i[:] for i in self.interval])
+
     def __repr__(self):
         '''
         print objects.
@@ -190,11 +173,91 @@ class Interval:
         Usage: [x, x] in a or [[x, x], [x, x]] not in a
         judge whether interval is in a or not, 'a' should be instance.
         '''
-        tmp = self.__mul__(interval).interval
-        if tmp:
-            return True
-        else:
-            return False
+        for i in Interval.convert(interval):
+            if self.overlaps(int(i[0]), int(i[1])):
+                return True
+        return False
+
+    def overlaps(self, sta, end):
+        '''
+        Usage: a.overlaps(sta, end)
+        judge whether [sta, end] overlaps with 'a', in O(log n).
+        Zero-length intervals never overlap, as with a * b.
+        '''
+        starts, ends = self.bounds()
+        n = bisect_right(ends, sta)
+        while sta < end and n < len(starts) and starts[n] < end:
+            if starts[n] < ends[n]:
+                return True
+            n += 1
+        return False
+
+    def find(self, sta, end):
+        '''
+        Usage: a.find(sta, end)
+        extract intervals overlapping with [sta, end], in O(log n + k).
+        '''
+        if sta >= end:
+            return []
+        starts, ends = self.bounds()
+        return [i for i in self[bisect_right(ends, sta):bisect_left(starts, end)]
+                if i[0] < i[1]]
+
+    def contains_point(self, pos):
+        '''
+        Usage: a.contains_point(pos)
+        judge whether pos is covered by 'a', in O(log n).
+        '''
+        starts, ends = self.bounds()
+        n = bisect_right(starts, pos) - 1
+        return n >= 0 and pos < ends[n]
+
+    def query_batch(self, starts, ends):
+        '''
+        Usage: flag, base, first, last = a.query_batch(starts, ends)
+        query many [sta, end] ranges in one call. For the query n, flag[n]
+        tells whether it overlaps with 'a' (base[n] > 0), base[n] is the
+        number of overlapping bases and a[first[n]:last[n]] are the hit
+        intervals (empty if flag[n] is 0).
+        '''
+        tmp_sta, tmp_end = self.bounds()
+        cumlen = list(accumulate(map(sub, tmp_end, tmp_sta), initial=0))
+        first = array('q', map(bisect_right, repeat(tmp_end), starts))
+        last = array('q', map(bisect_left, repeat(tmp_sta), ends))
+        base = array('q', bytes(8 * len(first)))
+        for n, sta, end, i, j in zip(count(), starts, ends, first, last):
+            if i >= j or sta >= end:
+                last[n] = i
+                continue
+            base[n] = cumlen[j] - cumlen[i]
+            if sta > tmp_sta[i]:
+                base[n] -= sta - tmp_sta[i]
+            if end < tmp_end[j - 1]:
+                base[n] -= tmp_end[j - 1] - end
+            if not base[n]:
+                last[n] = i
+        flag = array('b', map(lt, first, last))
+        return flag, base, first, last
+
+    def bounds(self):
+        '''
+        Usage: a.bounds()
+        starts and ends of 'a', built once and kept until a.interval is
+        rebound.
+        '''
+        if self._bounds is None:
+            self._bounds = ([i[0] for i in self._interval],
+                            [i[1] for i in self._interval])
+        return self._bounds
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @interval.setter
+    def interval(self, interval):
+        self._interval = interval
+        self._bounds = None
 
     def complement(self, sta='#', end='#'):
         '''
@@ -228,8 +291,17 @@ class Interval:
         '''
         self.interval = self.__sub__(interval, 0).interval
 
+    def lazy(self):
+        '''
+        Usage: a.lazy()
+        deferred version of 'a', see LazyInterval.
+        '''
+        return LazyInterval(self)
+
     @classmethod
     def convert(cls, interval):
+        if isinstance(interval, (Interval, ArrayInterval, DynamicInterval)):
+            return interval.interval
         assert type(interval) is list, 'Error: the type you use is {}'.format(type(interval))
         if not interval:
             return interval
@@ -238,6 +310,888 @@ class Interval:
         else:
             return [interval]
 
+    @classmethod
+    def fromsorted(cls, interval):
+        '''
+        wrap sorted and mutually exclusive intervals without copying them.
+        '''
+        obj = cls.__new__(cls)
+        obj.interval = interval
+        return obj
+
+    @classmethod
+    def coalesce(cls, interval):
+        '''
+        merge sorted intervals into mutually exclusive ones without editing
+        them, intervals which are not merged are shared with the input.
+        '''
+        return list(_union(interval))
+
+    @classmethod
+    def union_all(cls, sets):
+        '''
+        Interval.union_all(sets) -> Interval
+        union of many instances (or nested lists) with one k-way merge, the
+        same intervals as sets[0] + sets[1] + ... + sets[-1], with the tags
+        in the order of Interval(sets[0].interval + ... + sets[-1].interval).
+        '''
+        return cls.fromsorted(cls.coalesce(heapq.merge(*map(_rows, sets))))
+
+    @classmethod
+    def intersect_all(cls, sets):
+        '''
+        Interval.intersect_all(sets) -> Interval
+        intersection of many instances (or nested lists) with one k-way
+        sweep, the same as sets[0] * sets[1] * ... * sets[-1].
+        '''
+        tmp = []
+        rows = [_rows(i) for i in sets]
+        for sta, end, count, active in _sweep(rows):
+            if count == len(rows):
+                tmp.append([sta, end] + [tag for i in active for tag in i[2:]])
+        return cls.fromsorted(tmp)
+
+    @classmethod
+    def atleast(cls, sets, k):
+        '''
+        Interval.atleast(sets, k) -> Interval
+        regions covered by at least k of the instances (or nested lists),
+        without tags.
+        '''
+        assert k > 0, 'Error: k should be positive'
+        tmp = []
+        for sta, end, count, active in _sweep([_rows(i) for i in sets]):
+            if count >= k:
+                if tmp and tmp[-1][1] == sta:
+                    tmp[-1][1] = end
+                else:
+                    tmp.append([sta, end])
+        return cls.fromsorted(tmp)
+
+    @classmethod
+    def sort(cls, interval):
+        '''
+        sort intervals in place, the same order as interval.sort().
+        Above Interval.sort_threshold, intervals are sorted on their integer
+        starts first (much cheaper than comparing whole lists), and only the
+        runs sharing a start are then sorted on the whole interval.
+        '''
+        if len(interval) < cls.sort_threshold:
+            interval.sort()
+            return
+        interval.sort(key=itemgetter(0))
+        starts = list(map(itemgetter(0), interval))
+        ties = compress(range(1, len(starts)), map(eq, starts[1:], starts))
+        sta = end = -1
+        for i in ties:
+            if i != end:
+                if end > sta:
+                    interval[sta:end] = sorted(interval[sta:end])
+                sta = i - 1
+            end = i + 1
+        if end > sta:
+            interval[sta:end] = sorted(interval[sta:end])
+
+
+class ArrayInterval:
+    '''
+    Class: ArrayInterval
+
+    Maintainer: Xiao-Ou Zhang
+
+    Version: 0.8.0
+
+    Requirements: Python 3.X
+
+    Usage: a = ArrayInterval(list) or a = ArrayInterval(Interval)
+           (the same input as Interval)
+    Notes: columnar version of Interval. starts and ends are kept in two
+           contiguous int64 buffers (array('q')) and the tags of every
+           interval are kept in a side table of tuples, so large interval
+           sets take a fraction of the memory of nested lists. All the
+           intervals will become mutually exclusive and be sorted after
+           instantiation, exactly as Interval does. Like Interval, instances
+           are copy-on-write and share their buffers with their operands.
+
+    Attributes: starts, ends, tags, interval (nested list view)
+
+    Functions: the same as Interval, and len(a), iter(a)
+    '''
+    def __init__(self, interval, instance_flag=0):
+        if isinstance(interval, ArrayInterval):
+            self.starts, self.ends, self.tags = (interval.starts,
+                                                 interval.ends,
+                                                 interval.tags)
+            return
+        if isinstance(interval, Interval):
+            interval, instance_flag = interval.interval, 1
+        triples = [(int(i[0]), int(i[1]), tuple(i[2:]))
+                   for i in Interval.convert(interval)]
+        if not instance_flag:
+            Interval.sort(triples)
+            triples = ArrayInterval.coalesce(triples)
+        self.fill(triples)
+
+    def fill(self, triples):
+        '''
+        Usage: a.fill(triples)
+        refill 'a' with sorted (start, end, tags) triples.
+        '''
+        self.starts = array('q', [i[0] for i in triples])
+        self.ends = array('q', [i[1] for i in triples])
+        self.tags = [i[2] for i in triples]
+
+    @property
+    def interval(self):
+        '''
+        nested list view of 'a', the same as Interval.interval.
+        '''
+        return self[:]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        for sta, end, tag in zip(self.starts, self.ends, self.tags):
+            yield [sta, end] + list(tag)
+
+    def __add__(self, interval):
+        '''
+        Usage: c = a + b or a += b
+        extract union intervals, 'a' should be instance.
+        '''
+        if isinstance(interval, ArrayInterval):
+            other = zip(interval.starts, interval.ends, interval.tags)
+        elif isinstance(interval, Interval):
+            other = ((i[0], i[1], tuple(i[2:])) for i in interval.interval)
+        else:
+            other = sorted((int(i[0]), int(i[1]), tuple(i[2:]))
+                           for i in Interval.convert(interval))
+        tmp = heapq.merge(zip(self.starts, self.ends, self.tags), other)
+        return ArrayInterval.fromtriples(ArrayInterval.coalesce(tmp))
+
+    def __radd__(self, interval):
+        '''
+        Usage: c = b + a
+        extract union intervals, 'a' should be instance.
+        '''
+        return self.__add__(interval)
+
+    def __mul__(self, interval, real_flag=1):
+        '''
+        Usage: c = a * b or a *= b
+        extract intersection intervals, 'a' should be instance.
+        '''
+        tmp = []
+        other = ArrayInterval.wrap(interval)
+        sta1, end1, tag1 = self.starts, self.ends, self.tags
+        sta2, end2, tag2 = other.starts, other.ends, other.tags
+        i, j = 0, 0
+        n1, n2 = len(sta1), len(sta2)
+        while i < n1 and j < n2:
+            sta = sta1[i] if sta1[i] > sta2[j] else sta2[j]
+            end = end1[i] if end1[i] < end2[j] else end2[j]
+            if sta < end:
+                if real_flag:
+                    tmp.append((sta, end, tag1[i] + tag2[j]))
+                else:
+                    tmp.append((sta1[i], end1[i], tag1[i]))
+            if end1[i] == end:
+                i += 1
+            if end2[j] == end:
+                j += 1
+        return ArrayInterval.fromtriples(tmp)
+
+    def __rmul__(self, interval):
+        '''
+        Usage: c = b * a
+        extract intersection intervals, 'a' should be instance.
+        '''
+        return self.__mul__(interval)
+
+    def __sub__(self, interval, real_flag=1):
+        '''
+        Usage: c = a - b or a -= b
+        extract difference intervals, 'a' should be instance.
+        '''
+        tmp = []
+        other = ArrayInterval.wrap(interval)
+        sta2, end2 = other.starts, other.ends
+        j, n2 = 0, len(sta2)
+        for sta, end, tag in zip(self.starts, self.ends, self.tags):
+            while j < n2 and end2[j] <= sta:
+                j += 1
+            k, pos = j, sta
+            while k < n2 and sta2[k] < end:
+                if sta2[k] > pos:
+                    if real_flag:
+                        tmp.append((pos, sta2[k], tag))
+                    else:
+                        tmp.append((sta, end, tag))
+                pos = end2[k]
+                k += 1
+            if pos < end:
+                if real_flag:
+                    tmp.append((pos, end, tag))
+                else:
+                    tmp.append((sta, end, tag))
+        return ArrayInterval.fromtriples(tmp)
+
+    def __rsub__(self, interval):
+        '''
+        Usage: c = b - a
+        extract difference intervals, 'a' should be instance.
+        '''
+        return ArrayInterval(interval).__sub__(self)
+
+    def __getitem__(self, index):
+        '''
+        Usage: a[n] or a[n:m]
+        intercept index and slice on interval objects.
+        '''
+        if isinstance(index, slice):
+            return [[self.starts[i], self.ends[i]] + list(self.tags[i])
+                    for i in range(*index.indices(len(self.starts)))]
+        return [self.starts[index], self.ends[index]] + list(self.tags[index])
+
+    def __repr__(self):
+        '''
+        print objects.
+        '''
+        return repr(self.interval)
+
+    def __contains__(self, interval):
+        '''
+        Usage: [x, x] in a or [[x, x], [x, x]] not in a
+        judge whether interval is in a or not, 'a' should be instance.
+        '''
+        for i in Interval.convert(interval):
+            if self.overlaps(int(i[0]), int(i[1])):
+                return True
+        return False
+
+    overlaps = Interval.overlaps
+    find = Interval.find
+    contains_point = Interval.contains_point
+    query_batch = Interval.query_batch
+    lazy = Interval.lazy
+
+    def bounds(self):
+        '''
+        Usage: a.bounds()
+        starts and ends of 'a'.
+        '''
+        return self.starts, self.ends
+
+    def complement(self, sta='#', end='#'):
+        '''
+        Usage: a.complement(sta, end)
+        complement of 'a'.
+        '''
+        tmp = []
+        if not self.starts:
+            if sta != '#' and end != '#' and sta < end:
+                tmp.append((sta, end, ()))
+            self.fill(tmp)
+            return
+        if sta != '#' and sta < self.starts[0]:
+            tmp.append((sta, self.starts[0], ()))
+        for a, b in zip(self.ends, self.starts[1:]):
+            if a != b:
+                tmp.append((a, b, ()))
+        a = self.ends[-1]
+        if end != '#' and end > a:
+            tmp.append((a, end, ()))
+        self.fill(tmp)
+
+    def extractwith(self, interval):
+        '''
+        Usage: a.extractwith(b)
+        extract intervals in 'b'.
+        '''
+        tmp = self.__mul__(interval, 0)
+        self.starts, self.ends, self.tags = tmp.starts, tmp.ends, tmp.tags
+
+    def extractwithout(self, interval):
+        '''
+        Usage: a.extractwithout(b)
+        extract intervals not in 'b'.
+        '''
+        tmp = self.__sub__(interval, 0)
+        self.starts, self.ends, self.tags = tmp.starts, tmp.ends, tmp.tags
+
+    @classmethod
+    def wrap(cls, interval):
+        '''
+        return 'interval' as an ArrayInterval, without copying if it is
+        already one.
+        '''
+        if isinstance(interval, ArrayInterval):
+            return interval
+        return cls(interval)
+
+    @classmethod
+    def fromtriples(cls, triples):
+        '''
+        build an ArrayInterval from sorted and mutually exclusive
+        (start, end, tags) triples.
+        '''
+        obj = cls.__new__(cls)
+        obj.fill(triples)
+        return obj
+
+    @classmethod
+    def coalesce(cls, triples):
+        '''
+        merge sorted (start, end, tags) triples into mutually exclusive
+        ones, tags are concatenated in order.
+        '''
+        tmp = []
+        it = iter(triples)
+        for sta, end, tag in it:
+            tag = list(tag)
+            break
+        else:
+            return tmp
+        for a, b, t in it:
+            if end <= a:
+                tmp.append((sta, end, tuple(tag)))
+                sta, end, tag = a, b, list(t)
+            else:
+                end = b if b > end else end
+                tag.extend(t)
+        tmp.append((sta, end, tuple(tag)))
+        return tmp
+
+
+class DynamicInterval:
+    '''
+    Class: DynamicInterval
+
+    Maintainer: Xiao-Ou Zhang
+
+    Version: 0.8.0
+
+    Requirements: Python 3.X
+
+    Usage: a = DynamicInterval() or a = DynamicInterval(list / Interval)
+           a += [sta, end, f1...]
+           a -= [sta, end]
+    Notes: updatable version of Interval for streaming use, such as
+           tracking the regions covered by reads as they arrive. The
+           sorted and mutually exclusive intervals are kept in buckets of
+           at most 2 * DynamicInterval.load intervals (a flat B-tree), so
+           a += b and a -= b only touch the intervals overlapping with
+           'b', in O(log n) amortized for every interval of 'b', instead of
+           copying and sorting all the n intervals. Overlapping intervals
+           are merged as Interval does, and b + c, b * c, b - c give the
+           same intervals as Interval, except that - keeps zero-length
+           intervals which it does not overlap (Interval drops them all).
+           Intervals are never edited in place, so they may be shared with
+           Interval instances.
+
+    Attributes: interval
+
+    Functions: a += b, a -= b
+               c = a + b, c = a * b, c = a - b (and b + a, b * a, b - a)
+               a.gaps(sta, end)
+               a.complement(sta, end)
+               a.overlaps(sta, end)
+               a.find(sta, end)
+               a.contains_point(pos)
+               [x, x] in a, len(a), iter(a), a.copy()
+    '''
+    load = 512
+
+    def __init__(self, interval=None):
+        self._build(_rows(interval) if interval is not None else [])
+
+    def _build(self, interval):
+        load = self.load
+        self._rows = [interval[n:n + load]
+                      for n in range(0, len(interval), load)]
+        self._starts = [[i[0] for i in rows] for rows in self._rows]
+        self._heads = [starts[0] for starts in self._starts]
+        self._len = len(interval)
+
+    def _locate(self, pos):
+        b = bisect_left(self._heads, pos) - 1
+        if b < 0:
+            return 0, 0
+        return b, bisect_left(self._starts[b], pos)
+
+    def _before(self, b, i):
+        while b >= 0:
+            while i > 0:
+                i -= 1
+                yield b, i
+            b -= 1
+            i = len(self._rows[b]) if b >= 0 else 0
+
+    def _hits(self, sta, end):
+        tmp = []
+        for b, i in self._before(*self._locate(end)):
+            if self._rows[b][i][1] <= sta:
+                break
+            tmp.append((b, i))
+        return tmp
+
+    def _delete(self, hits):
+        for b, i in hits:
+            del self._rows[b][i]
+            del self._starts[b][i]
+            if self._rows[b]:
+                self._heads[b] = self._starts[b][0]
+            else:
+                del self._rows[b], self._starts[b], self._heads[b]
+        self._len -= len(hits)
+
+    def _insert(self, interval):
+        sta = interval[0]
+        if not self._rows:
+            self._rows, self._starts, self._heads = [[]], [[]], [sta]
+        b = max(bisect_left(self._heads, sta) - 1, 0)
+        rows, starts = self._rows[b], self._starts[b]
+        i = bisect_left(starts, sta)
+        while True:
+            if (i == len(starts) and b + 1 < len(self._heads) and
+                    self._heads[b + 1] == sta):
+                b, i = b + 1, 0
+                rows, starts = self._rows[b], self._starts[b]
+            elif i < len(starts) and starts[i] == sta and rows[i] < interval:
+                i += 1
+            else:
+                break
+        rows.insert(i, interval)
+        starts.insert(i, sta)
+        self._heads[b] = starts[0]
+        if len(rows) > 2 * self.load:
+            self._rows[b:b + 1] = [rows[:self.load], rows[self.load:]]
+            self._starts[b:b + 1] = [starts[:self.load], starts[self.load:]]
+            self._heads.insert(b + 1, starts[self.load])
+        self._len += 1
+
+    def _add(self, interval, n, k):
+        sta, end = interval[n][0], interval[n][1]
+        while True:
+            while k < len(interval) and interval[k][0] < end:
+                end = interval[k][1] if interval[k][1] > end else end
+                k += 1
+            hits = self._hits(sta, end)
+            last = max((self._rows[b][i][1] for b, i in hits), default=end)
+            if last <= end:
+                break
+            end = last
+        tmp = [self._rows[b][i] for b, i in reversed(hits)]
+        self._delete(hits)
+        for i in Interval.coalesce(heapq.merge(tmp, interval[n:k])):
+            self._insert(i)
+        return k
+
+    def _remove(self, sta, end):
+        hits = self._hits(sta, end)
+        tmp = []
+        for b, i in hits:
+            a = self._rows[b][i]
+            if sta > a[0]:
+                tmp.append([a[0], sta] + a[2:])
+            if end < a[1]:
+                tmp.append([end, a[1]] + a[2:])
+        self._delete(hits)
+        for i in tmp:
+            self._insert(i)
+
+    def __iadd__(self, interval):
+        '''
+        Usage: a += b
+        add intervals of 'b' to 'a' in place. The sorted intervals of 'b'
+        are merged in runs, every run together with the intervals of 'a'
+        it overlaps, so the tags are in the same order as Interval.
+        '''
+        if isinstance(interval, Interval):
+            tmp = interval.interval
+        else:
+            tmp = [[int(i[0]), int(i[1])] + i[2:]
+                   for i in Interval.convert(interval)]
+            Interval.sort(tmp)
+        n = 0
+        while n < len(tmp):
+            n = self._add(tmp, n, n + 1)
+        return self
+
+    def __isub__(self, interval):
+        '''
+        Usage: a -= b
+        remove intervals of 'b' from 'a' in place.
+        '''
+        for i in Interval.convert(interval):
+            self._remove(int(i[0]), int(i[1]))
+        return self
+
+    def __add__(self, interval):
+        '''
+        Usage: c = a + b
+        extract union intervals, 'a' should be instance.
+        '''
+        tmp = self.copy()
+        tmp += interval
+        return tmp
+
+    def __radd__(self, interval):
+        '''
+        Usage: c = b + a
+        extract union intervals, 'a' should be instance.
+        '''
+        return self.__add__(interval)
+
+    def __mul__(self, interval):
+        '''
+        Usage: c = a * b
+        extract intersection intervals, 'a' should be instance.
+        '''
+        return DynamicInterval(Interval.fromsorted(self.interval) * interval)
+
+    def __rmul__(self, interval):
+        '''
+        Usage: c = b * a
+        extract intersection intervals, 'a' should be instance.
+        '''
+        return self.__mul__(interval)
+
+    def __sub__(self, interval):
+        '''
+        Usage: c = a - b
+        extract difference intervals, 'a' should be instance.
+        '''
+        tmp = self.copy()
+        tmp -= interval
+        return tmp
+
+    def __rsub__(self, interval):
+        '''
+        Usage: c = b - a
+        extract difference intervals, 'a' should be instance.
+        '''
+        return DynamicInterval(Interval(interval) - self.interval)
+
+    def copy(self):
+        '''
+        Usage: a.copy()
+        copy of 'a', the intervals themselves are shared.
+        '''
+        tmp = DynamicInterval.__new__(DynamicInterval)
+        tmp._rows = [rows[:] for rows in self._rows]
+        tmp._starts = [starts[:] for starts in self._starts]
+        tmp._heads = self._heads[:]
+        tmp._len = self._len
+        return tmp
+
+    @property
+    def interval(self):
+        '''
+        nested list view of 'a', the same as Interval.interval.
+        '''
+        return [i for rows in self._rows for i in rows]
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for rows in self._rows:
+            yield from rows
+
+    def __getitem__(self, index):
+        '''
+        Usage: a[n] or a[n:m]
+        intercept index and slice on interval objects.
+        '''
+        return self.interval[index]
+
+    def __repr__(self):
+        '''
+        print objects.
+        '''
+        return repr(self.interval)
+
+    def __contains__(self, interval):
+        '''
+        Usage: [x, x] in a or [[x, x], [x, x]] not in a
+        judge whether interval is in a or not, 'a' should be instance.
+        '''
+        for i in Interval.convert(interval):
+            if self.overlaps(int(i[0]), int(i[1])):
+                return True
+        return False
+
+    def overlaps(self, sta, end):
+        '''
+        Usage: a.overlaps(sta, end)
+        judge whether [sta, end] overlaps with 'a', in O(log n).
+        '''
+        if sta >= end:
+            return False
+        for b, i in self._before(*self._locate(end)):
+            a = self._rows[b][i]
+            if a[1] <= sta:
+                return False
+            if a[0] < a[1]:
+                return True
+        return False
+
+    def find(self, sta, end):
+        '''
+        Usage: a.find(sta, end)
+        extract intervals overlapping with [sta, end], in O(log n + k).
+        '''
+        if sta >= end:
+            return []
+        return [self._rows[b][i] for b, i in reversed(self._hits(sta, end))
+                if self._rows[b][i][0] < self._rows[b][i][1]]
+
+    def contains_point(self, pos):
+        '''
+        Usage: a.contains_point(pos)
+        judge whether pos is covered by 'a', in O(log n).
+        '''
+        for b, i in self._before(*self._locate(pos + 1)):
+            return pos < self._rows[b][i][1]
+        return False
+
+    def gaps(self, sta, end):
+        '''
+        Usage: a.gaps(sta, end)
+        complement of 'a' inside [sta, end] as an Interval, in O(log n + k).
+        '''
+        tmp = []
+        for i in self.find(sta, end):
+            if i[0] > sta:
+                tmp.append([sta, i[0]])
+            sta = i[1] if i[1] > sta else sta
+        if sta < end:
+            tmp.append([sta, end])
+        return Interval.fromsorted(tmp)
+
+    def complement(self, sta='#', end='#'):
+        '''
+        Usage: a.complement(sta, end)
+        complement of 'a', the same as Interval.complement.
+        '''
+        tmp = Interval.fromsorted(self.interval)
+        tmp.complement(sta, end)
+        self._build(tmp.interval)
+
+
+class LazyInterval:
+    '''
+    Class: LazyInterval
+
+    Maintainer: Xiao-Ou Zhang
+
+    Version: 0.8.0
+
+    Requirements: Python 3.X
+
+    Usage: c = (a.lazy() + b) * c - d
+           c.evaluate()
+    Notes: deferred version of the Interval operators. +, * and - only
+           build an expression graph, and evaluate() runs the whole
+           expression as a pipeline of generators, every operator
+           consuming the sorted intervals of its operands as they are
+           produced, so no intermediate Interval is made. The result is
+           the same as the eager expression, tags and all (an ArrayInterval
+           operand counts as Interval(operand)).
+
+    Functions: c = a + b, c = a * b, c = a - b (and b + a, b * a, b - a)
+               c.evaluate()
+    '''
+    def __init__(self, interval, op=None, right=None):
+        if op is None and not isinstance(interval, (Interval, ArrayInterval)):
+            interval = [[int(i[0]), int(i[1])] + i[2:]
+                        for i in Interval.convert(interval)]
+            Interval.sort(interval)
+        self.left, self.op, self.right = interval, op, right
+
+    def __add__(self, interval):
+        return LazyInterval(self, '+', LazyInterval.wrap(interval))
+
+    def __radd__(self, interval):
+        return self.__add__(interval)
+
+    def __mul__(self, interval):
+        return LazyInterval(self, '*', LazyInterval.wrap(interval))
+
+    def __rmul__(self, interval):
+        return self.__mul__(interval)
+
+    def __sub__(self, interval):
+        return LazyInterval(self, '-', LazyInterval.wrap(interval))
+
+    def __rsub__(self, interval):
+        return LazyInterval(LazyInterval.wrap(interval), '-', self)
+
+    def __repr__(self):
+        '''
+        print objects.
+        '''
+        if self.op is None:
+            return 'lazy({!r})'.format(self.left)
+        return '({!r} {} {!r})'.format(self.left, self.op, self.right)
+
+    def _stream(self, raw=False):
+        if self.op is None:
+            if isinstance(self.left, (Interval, ArrayInterval)):
+                return iter(self.left.interval)
+            # a nested list operand: a + b merges its sorted rows as they
+            # are, while Interval(b) is used by a * b and a - b
+            return iter(self.left) if raw else _union(self.left)
+        left = self.left._stream()
+        if self.op == '+':
+            return _union(heapq.merge(left, self.right._stream(True)))
+        elif self.op == '*':
+            return _product(left, self.right._stream())
+        else:
+            return _difference(left, self.right._stream())
+
+    def evaluate(self):
+        '''
+        Usage: c.evaluate()
+        compute the expression, as an Interval.
+        '''
+        return Interval.fromsorted(list(self._stream()))
+
+    @classmethod
+    def wrap(cls, interval):
+        '''
+        return 'interval' as a LazyInterval, without copying if it is
+        already one.
+        '''
+        if isinstance(interval, LazyInterval):
+            return interval
+        return cls(interval)
+
+
+def _union(interval):
+    '''
+    merge sorted intervals as they come, see Interval.coalesce.
+    '''
+    it = iter(interval)
+    for a in it:
+        break
+    else:
+        return
+    shared = True
+    for b in it:
+        if a[1] <= b[0]:
+            yield a
+            a, shared = b, True
+        else:
+            if shared:
+                a, shared = a[:], False
+            a[1] = b[1] if b[1] > a[1] else a[1]
+            a.extend(b[2:])
+    yield a
+
+
+def _product(interval1, interval2, real_flag=1):
+    '''
+    intersect two sorted and mutually exclusive interval streams, see
+    Interval.__mul__.
+    '''
+    it1, it2 = iter(interval1), iter(interval2)
+    a, b = next(it1, None), next(it2, None)
+    if a is None or b is None:
+        return
+    while True:
+        sta = a[0] if a[0] > b[0] else b[0]
+        end = a[1] if a[1] < b[1] else b[1]
+        if sta < end:
+            yield [sta, end] + a[2:] + b[2:] if real_flag else a
+        if a[1] == end:
+            a = next(it1, None)
+            if a is None:
+                return
+        if b[1] == end:
+            b = next(it2, None)
+            if b is None:
+                return
+
+
+def _difference(interval1, interval2, real_flag=1):
+    '''
+    subtract a sorted and mutually exclusive interval stream from another,
+    see Interval.__sub__. Only the intervals of the second stream around
+    the current interval of the first one are kept.
+    '''
+    it2 = iter(interval2)
+    buf = deque()
+    for a in interval1:
+        while True:
+            if not buf:
+                b = next(it2, None)
+                if b is None:
+                    break
+                buf.append(b)
+            if buf[0][1] > a[0]:
+                break
+            buf.popleft()
+        k, sta = 0, a[0]
+        while True:
+            if k == len(buf):
+                b = next(it2, None)
+                if b is None:
+                    break
+                buf.append(b)
+            if buf[k][0] >= a[1]:
+                break
+            if buf[k][0] > sta:
+                yield [sta, buf[k][0]] + a[2:] if real_flag else a
+            sta = buf[k][1]
+            k += 1
+        if sta < a[1]:
+            if real_flag and sta != a[0]:
+                yield [sta, a[1]] + a[2:]
+            else:
+                yield a
+
+
+def _rows(interval):
+    if isinstance(interval, (Interval, ArrayInterval, DynamicInterval)):
+        return interval.interval
+    return Interval(interval).interval
+
+
+def _events(n, interval):
+    for i in interval:
+        if i[0] < i[1]:
+            yield i[0], 1, n, i
+            yield i[1], 0, n, None
+
+
+def _sweep(intervals):
+    '''
+    k-way sweep over sorted and mutually exclusive interval lists. Yield
+    (sta, end, count, active) for every piece covered by at least one of
+    them, active[n] is the interval of the n-th list covering the piece (or
+    None) and count is the number of lists covering it. active is reused,
+    use it before the next piece.
+    '''
+    active = [None] * len(intervals)
+    count = 0
+    last = None
+    events = heapq.merge(*(_events(n, i) for n, i in enumerate(intervals)),
+                         key=itemgetter(0, 1))
+    for pos, flag, n, i in events:
+        if count and pos > last:
+            yield last, pos, count, active
+        last = pos
+        if flag:
+            active[n] = i
+            count += 1
+        else:
+            active[n] = None
+            count -= 1
+
+
 if __name__ == '__main__':
     # testing codes:
     print('testing codes:')
@@ -426,6 +1380,21 @@ if __name__ == '__main__':
     print('[[31, 32], [33, 34]] in a: ', [[31, 32], [33, 34]] in a)
     print('[[31, 32], [33, 37]] in a: ', [[31, 32], [33, 37]] in a)
     print('[[27, 32], [33, 37]] in a: ', [[27, 32], [33, 37]] in a)
+    # a.overlaps(sta, end), a.find(sta, end), a.contains_point(pos)
+    print('a.overlaps(27, 34): ', a.overlaps(27, 34))
+    print('a.overlaps(12, 17): ', a.overlaps(12, 17))
+    print('a.find(10, 31): ', a.find(10, 31))
+    print('a.contains_point(12): ', a.contains_point(12))
+    print('a.contains_point(11): ', a.contains_point(11))
+    print('a.query_batch([0, 11, 26], [5, 31, 29]): ',
+          a.query_batch([0, 11, 26], [5, 31, 29]))
+    print('Interval([[27, 32]]) in a: ', Interval([[27, 32]]) in a)
+    print('Interval([[31, 32]]) in a: ', Interval([[31, 32]]) in a)
+    z = Interval([[67, 67], [5, 18]])
+    print('z = Interval([[67, 67], [5, 18]]), [19, 103] in z: ',
+          [19, 103] in z)
+    print('z.find(19, 103), z.query_batch([19], [103]): ', z.find(19, 103),
+          z.query_batch([19], [103]))
     # a.complement(sta, end)
     a.complement(0, 40)
     print('a.complement(0, 40): ',  a)
@@ -452,3 +1421,56 @@ if __name__ == '__main__':
     print('a.extractwithout(e):')
     print('a: ', a)
     print('e: ', e)
+    print('\n')
+    print('deal with ArrayInterval (should be the same as Interval):')
+    a = copy.deepcopy(a_copy)
+    b = b.interval
+    x = ArrayInterval(a.interval)
+    print('x = ArrayInterval(a): ', x)
+    print('x + b: ', x + b, a + b)
+    print('b + x: ', b + x, b + a)
+    print('x * b: ', x * b, a * b)
+    print('x - b: ', x - b, a - b)
+    print('b - x: ', b - x, b - a)
+    print('x + e: ', x + e, a + e)
+    print('x * e: ', x * e, a * e)
+    print('x - e: ', x - e, a - e)
+    print('x[1], x[:2]: ', x[1], x[:2])
+    print('[27, 34] in x: ', [27, 34] in x)
+    print('[31, 37] in x: ', [31, 37] in x)
+    print('[[27, 32], [33, 34]] in x: ', [[27, 32], [33, 34]] in x)
+    print('Interval([[27, 32]]) in x: ', Interval([[27, 32]]) in x)
+    x.complement(0, 40)
+    print('x.complement(0, 40): ', x)
+    x = ArrayInterval(a)
+    x.extractwith(b)
+    print('x.extractwith(b): ', x)
+    x = ArrayInterval(a)
+    x.extractwithout(b)
+    print('x.extractwithout(b): ', x)
+    print('\n')
+    print('deal with LazyInterval (should be the same as Interval):')
+    c = (a.lazy() + b) * e - [[20, 25]]
+    print('c = (a.lazy() + b) * e - [[20, 25]]: ', c)
+    print('c.evaluate(): ', c.evaluate())
+    print('(a + b) * e - [[20, 25]]: ', (a + b) * e - [[20, 25]])
+    print('\n')
+    print('deal with many instances:')
+    print('Interval.union_all([a, b, e]): ', Interval.union_all([a, b, e]),
+          a + b + e)
+    print('Interval.intersect_all([a, b, e]): ',
+          Interval.intersect_all([a, b, e]), a * b * e)
+    print('Interval.atleast([a, b, e], 2): ', Interval.atleast([a, b, e], 2))
+    print('\n')
+    print('deal with DynamicInterval (should be the same as Interval):')
+    y = DynamicInterval(a)
+    y += [24, 31, 'f']
+    print('y = DynamicInterval(a), y += [24, 31, \'f\']: ', y,
+          a + [[24, 31, 'f']])
+    y -= [[5, 8], [20, 22]]
+    print('y -= [[5, 8], [20, 22]]: ', y)
+    print('y.find(10, 30), y.contains_point(8): ', y.find(10, 30),
+          y.contains_point(8))
+    print('Interval([[24, 26]]) in y, [19, 103] in DynamicInterval(z): ',
+          Interval([[24, 26]]) in y, [19, 103] in DynamicInterval(z))
+    print('y.gaps(0, 40): ', y.gaps(0, 40))
@@ -0,0 +1,253 @@
+'''
+loader.py - Load BED/BED12/GTF/refFlat annotations into interval objects.
+author: Xiao-Ou Zhang
+version: 0.1.0
+'''
+
+import gzip
+import re
+from array import array
+from itertools import groupby
+from operator import itemgetter
+from interval import ArrayInterval, Interval
+from map import MapIndex
+from nclist import NCList
+
+_COMMENT = (b'#', b'track', b'browser')
+
+
+class Features:
+    '''
+    Class: Features
+
+    Maintainer: Xiao-Ou Zhang
+
+    Version: 0.1.0
+
+    Requirements: Python 3.X
+
+    Usage: features = loadbed(path)[chrom]
+    Notes: features of one chromosome (or one (chrom, strand)) as loaded
+           from an annotation file: starts and ends in array('q') columns
+           and a list of tag tuples, in file order and not merged. They are
+           turned into Interval, ArrayInterval, MapIndex or NCList without
+           going through nested lists of strings.
+
+    Attributes: sta, end, tags
+
+    Functions: features.extend(sta, end, tags)
+               features.interval()
+               features.arrayinterval()
+               features.mapindex(allhits)
+               features.nclist()
+               len(features)
+    '''
+    def __init__(self):
+        self.sta = array('q')
+        self.end = array('q')
+        self.tags = []
+
+    def extend(self, sta, end, tags):
+        '''
+        Usage: features.extend(sta, end, tags)
+        append columns of features.
+        '''
+        self.sta.extend(sta)
+        self.end.extend(end)
+        self.tags.extend(tags)
+
+    def __len__(self):
+        return len(self.sta)
+
+    def __repr__(self):
+        '''
+        print objects.
+        '''
+        return repr([[sta, end] + list(tag)
+                     for sta, end, tag in zip(self.sta, self.end, self.tags)])
+
+    def interval(self):
+        '''
+        Usage: features.interval()
+        features as an Interval, the same as Interval(nested list).
+        '''
+        rows = [[sta, end] + list(tag)
+                for sta, end, tag in zip(self.sta, self.end, self.tags)]
+        Interval.sort(rows)
+        return Interval.fromsorted(Interval.coalesce(rows))
+
+    def arrayinterval(self):
+        '''
+        Usage: features.arrayinterval()
+        features as an ArrayInterval, the same as ArrayInterval(nested list).
+        '''
+        triples = list(zip(self.sta, self.end, self.tags))
+        Interval.sort(triples)
+        return ArrayInterval.fromtriples(ArrayInterval.coalesce(triples))
+
+    def mapindex(self, allhits=False):
+        '''
+        Usage: features.mapindex(allhits)
+        features as a MapIndex, ids in index.order are positions in file
+        order.
+        '''
+        return MapIndex.fromcolumns(self.sta, self.end,
+                                    [list(tag) for tag in self.tags], allhits)
+
+    def nclist(self):
+        '''
+        Usage: features.nclist()
+        features as an NCList, ids are positions in file order.
+        '''
+        return NCList.fromcolumns(self.sta, self.end, self.tags)
+
+
+def _open(path):
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _chunks(path, chunksize):
+    with _open(path) as f:
+        rest = b''
+        while True:
+            data = f.read(chunksize)
+            if not data:
+                break
+            data = rest + data
+            n = data.rfind(b'\n')
+            if n < 0:
+                rest = data
+                continue
+            rest = data[n + 1:]
+            yield [line for line in data[:n].split(b'\n')
+                   if line.strip() and not line.startswith(_COMMENT)]
+        if rest.strip() and not rest.startswith(_COMMENT):
+            yield [rest]
+
+
+def _load(path, parse, chunksize):
+    table = {}
+    for lines in _chunks(path, chunksize):
+        keys, sta, end, tags = parse(lines)
+        n = 0
+        for key, group in groupby(keys):
+            k = n + sum(1 for i in group)
+            if type(key) is tuple:
+                key = tuple(i.decode() for i in key)
+            else:
+                key = key.decode()
+            if key not in table:
+                table[key] = Features()
+            table[key].extend(sta[n:k], end[n:k], tags[n:k])
+            n = k
+    return table
+
+
+def _keys(rows, chrom, strand, stranded):
+    if not stranded:
+        return list(map(itemgetter(chrom), rows))
+    return [(i[chrom], i[strand] if len(i) > strand else b'.') for i in rows]
+
+
+def loadbed(path, stranded=False, chunksize=1 << 22):
+    '''
+    loadbed(path, stranded=False) -> {chrom: Features}
+    Load a BED file (gzipped or not) in chunks. The name column (if any)
+    becomes the tag, and keys are (chrom, strand) if stranded.
+    '''
+    def parse(lines):
+        rows = [line.split() for line in lines]
+        sta = list(map(int, map(itemgetter(1), rows)))
+        end = list(map(int, map(itemgetter(2), rows)))
+        tags = [(i[3].decode(),) if len(i) > 3 else () for i in rows]
+        return _keys(rows, 0, 5, stranded), sta, end, tags
+    return _load(path, parse, chunksize)
+
+
+def loadbed12(path, stranded=False, chunksize=1 << 22):
+    '''
+    loadbed12(path, stranded=False) -> {chrom: Features}
+    Load the blocks (exons) of a BED12 file, tagged with the name of their
+    transcript.
+    '''
+    def parse(lines):
+        keys, sta, end, tags = [], [], [], []
+        rows = [line.split() for line in lines]
+        for key, i in zip(_keys(rows, 0, 5, stranded), rows):
+            base = int(i[1])
+            tag = (i[3].decode(),)
+            size = [int(k) for k in i[10].split(b',') if k]
+            start = [base + int(k) for k in i[11].split(b',') if k]
+            keys.extend([key] * len(start))
+            sta.extend(start)
+            end.extend(map(sum, zip(start, size)))
+            tags.extend([tag] * len(start))
+        return keys, sta, end, tags
+    return _load(path, parse, chunksize)
+
+
+def loadgtf(path, feature='exon', attribute='transcript_id', stranded=False,
+            chunksize=1 << 22):
+    '''
+    loadgtf(path, feature='exon', attribute='transcript_id', stranded=False)
+    -> {chrom: Features}
+    Load the features of one type from a GTF/GFF file, coordinates become
+    0-based and half-open, and the value of attribute is the tag.
+    '''
+    value = re.compile(attribute.encode() + rb'[ =]"?([^";]+)')
+    feature = feature.encode()
+
+    def parse(lines):
+        rows = [i for i in (line.split(b'\t') for line in lines)
+                if i[2] == feature]
+        sta = [int(i) - 1 for i in map(itemgetter(3), rows)]
+        end = list(map(int, map(itemgetter(4), rows)))
+        tags = []
+        for i in rows:
+            match = value.search(i[8])
+            tags.append((match.group(1).decode(),) if match else ())
+        return _keys(rows, 0, 6, stranded), sta, end, tags
+    return _load(path, parse, chunksize)
+
+
+def loadrefflat(path, chrom=1, strand=2, starts=6, ends=7, stranded=False,
+                chunksize=1 << 22):
+    '''
+    loadrefflat(path, chrom=1, strand=2, starts=6, ends=7, stranded=False)
+    -> {chrom: Features}
+    Load the exons of a transcript table with comma-separated exon starts
+    and ends (columns counted from 0, the format bpkm.readisoform reads),
+    tagged with the first column.
+    '''
+    def parse(lines):
+        keys, sta, end, tags = [], [], [], []
+        rows = [line.split() for line in lines]
+        for key, i in zip(_keys(rows, chrom, strand, stranded), rows):
+            tag = (i[0].decode(),)
+            start = [int(k) for k in i[starts].split(b',') if k]
+            keys.extend([key] * len(start))
+            sta.extend(start)
+            end.extend(int(k) for k in i[ends].split(b',') if k)
+            tags.extend([tag] * len(start))
+        return keys, sta, end, tags
+    return _load(path, parse, chunksize)
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) != 2:
+        print('loader.py *.bed/*.gtf/*.txt[.gz]')
+        sys.exit(0)
+    name = sys.argv[1][:-3] if sys.argv[1].endswith('.gz') else sys.argv[1]
+    if name.endswith('.bed'):
+        table = loadbed(sys.argv[1])
+    elif name.endswith(('.gtf', '.gff')):
+        table = loadgtf(sys.argv[1])
+    else:
+        table = loadrefflat(sys.argv[1])
+    for key in sorted(table):
+        print(key, len(table[key]), len(table[key].arrayinterval()), sep='\t')
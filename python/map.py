@@ -1,75 +1,400 @@
 '''
 map.py - Deal with mapping.
 author: Xiao-Ou Zhang
-version: 0.3.0
+version: 0.4.0
 '''
 
+import heapq
+from array import array
+from collections import deque
+from operator import itemgetter
+from nclist import NCList
 
-def __init(interval):
+
+def _init(interval):
     mapping = [[int(i[0]), int(i[1])] + i[2:] for i in interval]
     mapping.sort()
     return mapping
 
 
-def __map(index, interval, flag):
-    mapped_fragment = []
+def _columns(interval):
+    sta = [int(i[0]) for i in interval]
+    end = [int(i[1]) for i in interval]
+    order = sorted(range(len(sta)), key=lambda n: (sta[n], end[n]))
+    return order, [sta[n] for n in order], [end[n] for n in order]
+
+
+def _stream(interval):
+    last = None
+    for i in interval:
+        sta, end = int(i[0]), int(i[1])
+        assert last is None or sta >= last, 'Error: {} is not sorted'.format(i)
+        last = sta
+        yield sta, end, i[2:]
+
+
+def _sweep(dex_sta, dex_end, fragments):
+    '''
+    Yield (n, sta, end, info) for every piece of fragments mapped onto the
+    n-th index interval. Index intervals are given by sorted dex_sta/dex_end,
+    fragments is an iterable of sorted (sta, end, info) items.
+    '''
+    fragments = iter(fragments)
+    queue = deque()
     tmp_fragment = []
-    if not interval:
-        if flag:
-            return mapped_fragment
-        else:
-            return index
-    for dex in index:
-        dex_info = dex[2:]
+    for n, dex_0, dex_1 in zip(range(len(dex_sta)), dex_sta, dex_end):
         while True:
-            try:
-                fragment = interval.pop(0)
-            except IndexError:
-                if tmp_fragment:
-                    interval.extend(tmp_fragment)
-                    tmp_fragment = []
-                    continue
-                else:
-                    if flag:
-                        return mapped_fragment
+            if queue:
+                fragment = queue.popleft()
+            else:
+                fragment = next(fragments, None)
+                if fragment is None:
+                    if tmp_fragment:
+                        queue.extend(tmp_fragment)
+                        tmp_fragment = []
+                        continue
                     else:
-                        return index
-            if fragment[0] >= dex[1]:
-                interval.insert(0, fragment)
-                interval[0:0] = tmp_fragment
+                        return
+            if fragment[0] >= dex_1:
+                queue.appendleft(fragment)
+                queue.extendleft(reversed(tmp_fragment))
                 tmp_fragment = []
                 break
-            elif dex[0] < fragment[1] and dex[1] > fragment[0]:
-                dex += fragment[2:]
-                sta = dex[0] if dex[0] > fragment[0] else fragment[0]
-                end = dex[1] if dex[1] < fragment[1] else fragment[1]
-                new_fragment = [sta, end] + fragment[2:] + dex_info
-                mapped_fragment.append(new_fragment)
-                if fragment[1] > dex[1]:
-                    tmp_fragment.append([dex[1],
-                                        fragment[1]] + fragment[2:])
-    else:
-        if flag:
-            return mapped_fragment
+            elif dex_0 < fragment[1] and dex_1 > fragment[0]:
+                sta = dex_0 if dex_0 > fragment[0] else fragment[0]
+                end = dex_1 if dex_1 < fragment[1] else fragment[1]
+                yield n, sta, end, fragment[2]
+                if fragment[1] > dex_1:
+                    tmp_fragment.append((dex_1, fragment[1], fragment[2]))
+
+
+def _allhits(dex_sta, dex_end, nclist, fragments):
+    '''
+    Yield (n, sta, end, info) for every pair of overlapping fragment and
+    n-th index interval, in fragment order. nclist is built on the sorted
+    dex_sta/dex_end, so its ids are index positions.
+    '''
+    for fragment in fragments:
+        for n in nclist.find(fragment[0], fragment[1]):
+            sta = dex_sta[n] if dex_sta[n] > fragment[0] else fragment[0]
+            end = dex_end[n] if dex_end[n] < fragment[1] else fragment[1]
+            yield n, sta, end, fragment[2]
+
+
+class MapIndex:
+    '''
+    Class: MapIndex
+
+    Maintainer: Xiao-Ou Zhang
+
+    Version: 0.4.0
+
+    Requirements: Python 3.X
+
+    Usage: index = MapIndex(list, allhits=False)
+           (nested list: [[x,x,f1...],[x,x,f2...]...] / [[x,x],[x,x]...])
+    Notes: the index is checked, int-converted and sorted only once, then
+           any number of interval batches can be mapped onto it. Coordinates
+           are kept in array('q') columns, so a MapIndex is cheap to pickle
+           and send to worker processes.
+           By default the sweep hands every base of a fragment to the first
+           index interval covering it, so overlapping index intervals share
+           out the fragment. With allhits, an NCList is built on the index
+           and every fragment is mapped onto all the index intervals it
+           overlaps, in O(log n + k) per fragment.
+
+    Attributes: sta, end, order (positions in the original list), info,
+                nclist (None without allhits)
+
+    Functions: index.mapto(interval)
+               index.overlapwith(interval)
+               index.mapto_compact(interval)
+               index.stream(interval, count=False)
+               len(index)
+               MapIndex.fromcolumns(sta, end, info, allhits)
+    '''
+    def __init__(self, index, allhits=False):
+        assert type(index) is list, 'Error: the type you use is {}'.format(type(index))
+        rows = [[int(i[0]), int(i[1])] + i[2:] for i in index]
+        for i in rows:
+            assert i[0] <= i[1], 'Error: the interval {} is illegal'.format(i)
+        order = sorted(range(len(rows)), key=rows.__getitem__)
+        self.sta = array('q', [rows[n][0] for n in order])
+        self.end = array('q', [rows[n][1] for n in order])
+        self.order = array('q', order)
+        self.info = [rows[n][2:] for n in order]
+        self.nclist = NCList.fromcolumns(self.sta, self.end) if allhits else None
+
+    @classmethod
+    def fromcolumns(cls, sta, end, info=None, allhits=False):
+        '''
+        build a MapIndex from start and end columns (lists or arrays of int)
+        and a list of tag lists, without making a nested list first.
+        '''
+        if info is None:
+            info = [[] for i in sta]
+        for a, b in zip(sta, end):
+            assert a <= b, 'Error: the interval {} is illegal'.format([a, b])
+        order = sorted(range(len(sta)), key=lambda n: (sta[n], end[n], info[n]))
+        obj = cls.__new__(cls)
+        obj.sta = array('q', [sta[n] for n in order])
+        obj.end = array('q', [end[n] for n in order])
+        obj.order = array('q', order)
+        obj.info = [info[n] for n in order]
+        obj.nclist = NCList.fromcolumns(obj.sta, obj.end) if allhits else None
+        return obj
+
+    def __len__(self):
+        return len(self.sta)
+
+    def _map(self, fragments):
+        if self.nclist is None:
+            return _sweep(self.sta, self.end, fragments)
+        return sorted(_allhits(self.sta, self.end, self.nclist, fragments),
+                      key=itemgetter(0))
+
+    def mapto(self, interval):
+        '''
+        index.mapto(interval) -> interval
+        Map interval onto index, the same as mapto(interval, index).
+        '''
+        mapped_fragment = []
+        fragments = ((i[0], i[1], i[2:]) for i in _init(interval))
+        for n, sta, end, info in self._map(fragments):
+            mapped_fragment.append([sta, end] + info + self.info[n])
+        return mapped_fragment
+
+    def overlapwith(self, interval):
+        '''
+        index.overlapwith(interval) -> index
+        Overlap index with interval, the same as overlapwith(index,
+        interval).
+        '''
+        index = [[sta, end] + info
+                 for sta, end, info in zip(self.sta, self.end, self.info)]
+        fragments = ((i[0], i[1], i[2:]) for i in _init(interval))
+        for n, sta, end, info in self._map(fragments):
+            index[n] += info
+        return index
+
+    def mapto_compact(self, interval):
+        '''
+        index.mapto_compact(interval) -> (sta, end, index_id, interval_id)
+        Map interval onto index, the same as mapto_compact(interval, index).
+        '''
+        order, sta, end = _columns(interval)
+        mapped = array('q'), array('q'), array('q'), array('q')
+        for n, a, b, i in self._map(zip(sta, end, order)):
+            mapped[0].append(a)
+            mapped[1].append(b)
+            mapped[2].append(self.order[n])
+            mapped[3].append(i)
+        return mapped
+
+    def stream(self, interval, count=False):
+        '''
+        index.stream(interval, count=False) -> generator
+        Map an iterator of intervals sorted by start onto index in a single
+        pass and yield the mapped fragments, or, if count is True, yield
+        (index interval, mapped bases) for every index interval in order.
+        Only the fragments overlapping the current index interval are held
+        in memory. With allhits, fragments are yielded in the order of
+        interval, and counts only once interval is exhausted.
+        '''
+        if self.nclist is None:
+            mapped = _sweep(self.sta, self.end, _stream(interval))
         else:
-            return index
+            mapped = _allhits(self.sta, self.end, self.nclist,
+                              _stream(interval))
+        if not count:
+            for n, sta, end, info in mapped:
+                yield [sta, end] + info + self.info[n]
+            return
+        if self.nclist is not None:
+            base = array('q', bytes(8 * len(self.sta)))
+            for n, sta, end, info in mapped:
+                base[n] += end - sta
+            for k in range(len(self.sta)):
+                yield [self.sta[k], self.end[k]] + self.info[k], base[k]
+            return
+        k, base = 0, 0
+        for n, sta, end, info in mapped:
+            while k < n:
+                yield [self.sta[k], self.end[k]] + self.info[k], base
+                k, base = k + 1, 0
+            base += end - sta
+        while k < len(self.sta):
+            yield [self.sta[k], self.end[k]] + self.info[k], base
+            k, base = k + 1, 0
+
+
+def mapto(interval, index, allhits=False):
+    '''
+    mapto(interval, index, allhits=False) -> interval
+    Map interval onto index. With allhits, every interval is mapped onto
+    all the overlapping index intervals, see MapIndex.
+    '''
+    return MapIndex(index, allhits).mapto(interval)
 
 
-def mapto(interval, index):
+def overlapwith(index, interval, allhits=False):
     '''
-    mapto(interval, index) -> interval
-    Map interval onto index.
+    overlapwith(index, interval, allhits=False) -> index
+    Overlap index with interval. With allhits, every index interval gets
+    the tags of all the overlapping intervals, see MapIndex.
     '''
-    tmp1 = __init(interval)
-    tmp2 = __init(index)
-    return __map(tmp2, tmp1, flag=1)
+    return MapIndex(index, allhits).overlapwith(interval)
 
 
-def overlapwith(index, interval):
+def mapto_compact(interval, index, allhits=False):
     '''
-    overlapwith(index, interval) -> index
-    Overlap index with interval.
+    mapto_compact(interval, index, allhits=False) -> (sta, end, index_id, interval_id)
+    Map interval onto index like mapto, but leave tags alone and return the
+    mapped fragments as four arrays. Ids are positions in index and
+    interval, neither of which is modified.
+    '''
+    return MapIndex(index, allhits).mapto_compact(interval)
+
+
+def overlapwith_compact(index, interval, allhits=False):
+    '''
+    overlapwith_compact(index, interval, allhits=False) -> (sta, end, index_id, interval_id)
+    Alias of mapto_compact(interval, index, allhits) with the arguments in
+    the order of overlapwith, the overlapping pieces are the same arrays.
+    '''
+    return mapto_compact(interval, index, allhits)
+
+
+def mapto_stream(interval, index, count=False, allhits=False):
     '''
-    tmp1 = __init(index)
-    tmp2 = __init(interval)
-    return __map(tmp1, tmp2, flag=0)
+    mapto_stream(interval, index, count=False, allhits=False) -> generator
+    Map an iterator of intervals sorted by start onto index in a single
+    pass, see MapIndex.stream.
+    '''
+    return MapIndex(index, allhits).stream(interval, count)
+
+
+def sortedblocks(reads):
+    '''
+    sortedblocks(reads) -> generator
+    Turn a coordinate-sorted iterator of split reads (lists of blocks as
+    readsplit returns) into an iterator of blocks sorted by start, holding
+    only the blocks of reads which span the current position.
+    '''
+    tmp = []
+    n = 0
+    for read in reads:
+        if not read:
+            continue
+        while tmp and tmp[0][0] <= read[0][0]:
+            yield heapq.heappop(tmp)[2]
+        for block in read:
+            heapq.heappush(tmp, (int(block[0]), n, block))
+            n += 1
+    while tmp:
+        yield heapq.heappop(tmp)[2]
+
+
+if __name__ == '__main__':
+    # testing codes: compare with the former list-based sweep
+    import pickle
+    import random
+
+    def list_map(index, interval, flag):
+        mapped_fragment = []
+        tmp_fragment = []
+        if not interval:
+            if flag:
+                return mapped_fragment
+            else:
+                return index
+        for dex in index:
+            dex_info = dex[2:]
+            while True:
+                try:
+                    fragment = interval.pop(0)
+                except IndexError:
+                    if tmp_fragment:
+                        interval.extend(tmp_fragment)
+                        tmp_fragment = []
+                        continue
+                    else:
+                        if flag:
+                            return mapped_fragment
+                        else:
+                            return index
+                if fragment[0] >= dex[1]:
+                    interval.insert(0, fragment)
+                    interval[0:0] = tmp_fragment
+                    tmp_fragment = []
+                    break
+                elif dex[0] < fragment[1] and dex[1] > fragment[0]:
+                    dex += fragment[2:]
+                    sta = dex[0] if dex[0] > fragment[0] else fragment[0]
+                    end = dex[1] if dex[1] < fragment[1] else fragment[1]
+                    new_fragment = [sta, end] + fragment[2:] + dex_info
+                    mapped_fragment.append(new_fragment)
+                    if fragment[1] > dex[1]:
+                        tmp_fragment.append([dex[1],
+                                            fragment[1]] + fragment[2:])
+        else:
+            if flag:
+                return mapped_fragment
+            else:
+                return index
+
+    def random_interval(num, tag):
+        tmp = []
+        for i in range(num):
+            sta = random.randint(0, 1000)
+            tmp.append([sta, sta + random.randint(0, 80), tag + str(i)])
+        return tmp
+
+    print('testing codes:')
+    random.seed(0)
+    for n in range(1000):
+        read = random_interval(random.randint(0, 60), 'r')
+        bed = random_interval(random.randint(0, 30), 'b')
+        assert mapto(read, bed) == list_map(_init(bed), _init(read), 1)
+        assert overlapwith(bed, read) == list_map(_init(bed), _init(read),
+                                                  0)
+        mapped = mapto([i[:2] + [n] for n, i in enumerate(read)],
+                       [i[:2] + [n] for n, i in enumerate(bed)])
+        compact = mapto_compact(read, bed)
+        index = pickle.loads(pickle.dumps(MapIndex(bed)))
+        assert index.mapto(read) == mapto(read, bed)
+        assert index.mapto_compact(read) == compact
+        assert list(index.stream(sorted(read))) == mapto(read, bed)
+        count = dict((i[2], 0) for i in bed)
+        for i in mapto(read, bed):
+            count[i[3]] += i[1] - i[0]
+        assert all(count[i[2]] == base
+                   for i, base in index.stream(sorted(read), count=True))
+        split = [sorted(random_interval(random.randint(1, 3), 'r'))
+                 for i in range(20)]
+        split.sort(key=lambda i: i[0][0])
+        blocks = list(sortedblocks(split))
+        assert blocks == sorted(blocks, key=lambda i: i[0])
+        assert sorted(blocks) == sorted(i for read in split for i in read)
+        assert mapped == [[a, b, c, d] for a, b, d, c in zip(*compact)]
+        index = MapIndex.fromcolumns([i[0] for i in bed], [i[1] for i in bed],
+                                     [i[2:] for i in bed])
+        assert index.mapto(read) == mapto(read, bed)
+        assert list(index.order) == list(MapIndex(bed).order)
+        hits = [[max(i[0], j[0]), min(i[1], j[1])] + i[2:] + j[2:]
+                for j in sorted(bed) for i in sorted(read)
+                if j[0] < i[1] and j[1] > i[0]]
+        assert mapto(read, bed, allhits=True) == hits
+        index = pickle.loads(pickle.dumps(MapIndex(bed, allhits=True)))
+        assert sorted(index.stream(sorted(read))) == sorted(hits)
+        count = dict((i[2], 0) for i in bed)
+        for i in hits:
+            count[i[3]] += i[1] - i[0]
+        assert all(count[i[2]] == base
+                   for i, base in index.stream(sorted(read), count=True))
+        overlap = overlapwith(bed, read, allhits=True)
+        assert overlap == [j + [i[2] for i in sorted(read)
+                                if j[0] < i[1] and j[1] > i[0]]
+                           for j in sorted(bed)]
+    print('mapto and overlapwith are the same as the list-based sweep')
+    print('with allhits, they are the same as brute force')
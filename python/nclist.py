@@ -0,0 +1,159 @@
+'''
+nclist.py - Query overlapping features without merging them.
+author: Xiao-Ou Zhang
+version: 0.1.0
+'''
+
+from array import array
+from bisect import bisect_right
+from collections import deque
+
+
+class NCList:
+    '''
+    Class: NCList
+
+    Maintainer: Xiao-Ou Zhang
+
+    Version: 0.1.0
+
+    Requirements: Python 3.X
+
+    Usage: nc = NCList(list)
+           (nested list: [[x,x,f1...],[x,x,f2...]...] / [[x,x],[x,x]...])
+    Notes: nested containment list. Unlike Interval, overlapping features are
+           not merged, so every feature keeps its identity. Features
+           contained in another one are moved into the sublist of that
+           feature, and all the sublists are laid out one after the other in
+           flat array('q') columns. Inside a sublist both starts and ends
+           are sorted, so a query binary searches every sublist it enters
+           and only enters the sublists of hit features, in O(log n + k).
+           A feature [s, e] overlaps [sta, end] if s < end and e > sta, the
+           same rule as map.mapto. Ids are positions in the original list.
+
+    For example: input:  [[1, 10, 'a'], [2, 5, 'b'], [8, 20, 'c']]
+                 nc.find(4, 9): [0, 1, 2]
+                 nc.find_point(12): [2]
+
+    Attributes: sta, end, id, sub_sta, sub_end (flat columns), info
+
+    Functions: nc.find(sta, end)
+               nc.find_point(pos)
+               nc.find_batch(starts, ends)
+               len(nc)
+               NCList.fromcolumns(sta, end, info)
+    '''
+    def __init__(self, interval):
+        assert type(interval) is list, 'Error: the type you use is {}'.format(type(interval))
+        sta = [int(i[0]) for i in interval]
+        end = [int(i[1]) for i in interval]
+        self._build(sta, end)
+        self.info = [i[2:] for i in interval]
+
+    def _build(self, sta, end):
+        for a, b in zip(sta, end):
+            assert a <= b, 'Error: the interval {} is illegal'.format([a, b])
+        order = sorted(range(len(sta)), key=lambda n: (sta[n], -end[n], n))
+        children = {-1: []}
+        stack = []
+        for n in order:
+            while stack and end[stack[-1]] < end[n]:
+                stack.pop()
+            children[stack[-1] if stack else -1].append(n)
+            children[n] = []
+            stack.append(n)
+        flat = []
+        sub = {}
+        queue = deque([-1])
+        while queue:
+            n = queue.popleft()
+            if children[n]:
+                sub[n] = len(flat), len(flat) + len(children[n])
+                flat.extend(children[n])
+                queue.extend(children[n])
+        self.sta = array('q', [sta[n] for n in flat])
+        self.end = array('q', [end[n] for n in flat])
+        self.id = array('q', flat)
+        self.sub_sta = array('q', [sub.get(n, (0, 0))[0] for n in flat])
+        self.sub_end = array('q', [sub.get(n, (0, 0))[1] for n in flat])
+        self._top = sub.get(-1, (0, 0))
+
+    def __len__(self):
+        return len(self.id)
+
+    def _hits(self, sta, end):
+        stack = [self._top]
+        while stack:
+            lo, hi = stack.pop()
+            n = bisect_right(self.end, sta, lo, hi)
+            while n < hi and self.sta[n] < end:
+                yield n
+                if self.sub_sta[n] < self.sub_end[n]:
+                    stack.append((self.sub_sta[n], self.sub_end[n]))
+                n += 1
+
+    def find(self, sta, end):
+        '''
+        Usage: nc.find(sta, end)
+        ids of features overlapping with [sta, end], in O(log n + k).
+        '''
+        return sorted(self.id[n] for n in self._hits(sta, end))
+
+    def find_point(self, pos):
+        '''
+        Usage: nc.find_point(pos)
+        ids of features covering pos.
+        '''
+        return self.find(pos, pos + 1)
+
+    def find_batch(self, starts, ends):
+        '''
+        Usage: query_id, feature_id = nc.find_batch(starts, ends)
+        query many [sta, end] ranges in one call, every overlapping pair is
+        returned as query_id[n] (position in starts) and feature_id[n].
+        '''
+        query_id, feature_id = array('q'), array('q')
+        for n, sta, end in zip(range(len(starts)), starts, ends):
+            hits = self.find(sta, end)
+            query_id.extend([n] * len(hits))
+            feature_id.extend(hits)
+        return query_id, feature_id
+
+    @classmethod
+    def fromcolumns(cls, sta, end, info=None):
+        '''
+        build an NCList from start and end columns (lists or arrays) without
+        making a nested list first.
+        '''
+        obj = cls.__new__(cls)
+        obj._build(sta, end)
+        obj.info = info
+        return obj
+
+
+if __name__ == '__main__':
+    # testing codes: compare with brute force
+    import random
+    print('testing codes:')
+    nc = NCList([[1, 10, 'a'], [2, 5, 'b'], [8, 20, 'c']])
+    print('nc.find(4, 9): ', nc.find(4, 9))
+    print('nc.find_point(12): ', nc.find_point(12))
+    random.seed(0)
+    for n in range(1000):
+        feature = []
+        for i in range(random.randint(0, 50)):
+            sta = random.randint(0, 1000)
+            feature.append([sta, sta + random.randint(0, 200)])
+        nc = NCList(feature)
+        starts = [random.randint(0, 1200) for i in range(20)]
+        ends = [i + random.randint(0, 100) for i in starts]
+        pairs = []
+        for k, sta, end in zip(range(20), starts, ends):
+            hits = [j for j, i in enumerate(feature)
+                    if i[0] < end and i[1] > sta]
+            assert nc.find(sta, end) == hits
+            assert nc.find_point(sta) == [j for j, i in enumerate(feature)
+                                          if i[0] <= sta < i[1]]
+            pairs.extend((k, j) for j in hits)
+        assert list(zip(*nc.find_batch(starts, ends))) == pairs
+    print('find, find_point and find_batch are the same as brute force')
@@ -0,0 +1,246 @@
+'''
+writer.py - Write tabular results in batches.
+author: Xiao-Ou Zhang
+version: 0.1.0
+'''
+
+import gzip
+import queue
+import struct
+import threading
+from array import array
+from bam import BGZFWriter
+
+_MAGIC = b'ULRESULT'
+_COUNT = struct.Struct('<II')
+_LENGTH = struct.Struct('<Q')
+
+
+class ResultWriter:
+    '''
+    Class: ResultWriter
+
+    Maintainer: Xiao-Ou Zhang
+
+    Version: 0.1.0
+
+    Requirements: Python 3.X
+
+    Usage: with ResultWriter(path, compress, binary, index) as out:
+               out.write(x, y, ...) or out.extend(xs, ys, ...)
+    Notes: rows are gathered in column buffers and every bufsize rows are
+           formatted in bulk and written with one call. The values of a
+           column of lists or tuples are spread over several fields (none
+           if empty), so the remaining BED columns can be one column.
+           compress is None, 'gzip' or 'bgzip', compression runs in a
+           background thread while the next rows are formatted.
+           binary writes a compact columnar format instead of text (int,
+           float and str columns, read back with readresults). index writes
+           path + '.idx' with the first row and the offset (the BGZF
+           virtual offset with bgzip) of every batch, for random access.
+
+    Functions: out.write(x, y, ...)
+               out.extend(xs, ys, ...)
+               out.flush()
+               out.close()
+    '''
+    def __init__(self, path, compress=None, binary=False, index=False,
+                 bufsize=1 << 16):
+        assert compress in (None, 'gzip', 'bgzip'), 'Error: unknown compression {}'.format(compress)
+        assert not (index and compress == 'gzip'), 'Error: gzip output can not be indexed, use bgzip'
+        self._file = open(path, 'wb')
+        if compress == 'gzip':
+            self._out = gzip.GzipFile(fileobj=self._file, mode='wb',
+                                      compresslevel=6)
+        elif compress == 'bgzip':
+            self._out = BGZFWriter(self._file)
+        else:
+            self._out = self._file
+        self._bgzip = compress == 'bgzip'
+        self._binary = binary
+        self._index = open(path + '.idx', 'w') if index else None
+        self._bufsize = bufsize
+        self._columns = None
+        self._rows = 0
+        self._error = None
+        self._queue = None
+        if binary:
+            self._put(None, _MAGIC)
+        if compress:
+            self._queue = queue.Queue(4)
+            self._thread = threading.Thread(target=self._work, daemon=True)
+            self._thread.start()
+
+    def _put(self, row, data):
+        if self._index is not None and row is not None:
+            if self._bgzip:
+                self._out.flush()
+            self._index.write('{}\t{}\n'.format(row, self._out.tell()))
+        self._out.write(data)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is None:
+                try:
+                    self._put(*item)
+                except Exception as error:
+                    self._error = error
+
+    def write(self, *row):
+        '''
+        Usage: out.write(x, y, ...)
+        add one row.
+        '''
+        if self._columns is None:
+            self._columns = [[] for i in row]
+        assert len(row) == len(self._columns), 'Error: {} is not a row of {} columns'.format(row, len(self._columns))
+        for column, value in zip(self._columns, row):
+            column.append(value)
+        if len(self._columns[0]) >= self._bufsize:
+            self.flush()
+
+    def extend(self, *columns):
+        '''
+        Usage: out.extend(xs, ys, ...)
+        add rows given as columns of the same length.
+        '''
+        if self._columns is None:
+            self._columns = [[] for i in columns]
+        assert len(columns) == len(self._columns), 'Error: {} columns are given instead of {}'.format(len(columns), len(self._columns))
+        assert len(set(map(len, columns))) <= 1, 'Error: columns are not of the same length'
+        for column, value in zip(self._columns, columns):
+            column.extend(value)
+        if len(self._columns[0]) >= self._bufsize:
+            self.flush()
+
+    def flush(self):
+        '''
+        Usage: out.flush()
+        format and write the buffered rows.
+        '''
+        if not self._columns:
+            return
+        for n in range(0, len(self._columns[0]), self._bufsize):
+            columns = [i[n:n + self._bufsize] for i in self._columns]
+            if self._binary:
+                item = self._rows, _packcolumns(columns)
+            else:
+                item = self._rows, _formatcolumns(columns)
+            self._rows += len(columns[0])
+            if self._queue is None:
+                self._put(*item)
+            else:
+                self._queue.put(item)
+            if self._error is not None:
+                raise self._error
+        self._columns = [[] for i in self._columns]
+
+    def close(self):
+        '''
+        Usage: out.close()
+        write the remaining rows and close the files.
+        '''
+        self.flush()
+        if self._queue is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._queue = None
+        self._out.close()
+        self._file.close()
+        if self._index is not None:
+            self._index.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _spread(column):
+    return isinstance(column[0], (list, tuple))
+
+
+def _formatcolumns(columns):
+    k = 0
+    while k < len(columns) and not _spread(columns[k]):
+        k += 1
+    lines = map('\t'.join, zip(*[map(str, i) for i in columns[:k]]))
+    if k < len(columns):
+        fields = [lines] if k else []
+        for column in columns[k:]:
+            if _spread(column):
+                fields.append(['\t' + '\t'.join(map(str, i)) if i else ''
+                               for i in column])
+            else:
+                fields.append(['\t' + i for i in map(str, column)])
+        lines = map(''.join, zip(*fields))
+        if not k:
+            lines = (i[1:] for i in lines)
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def _packcolumns(columns):
+    tmp = [_COUNT.pack(len(columns[0]), len(columns))]
+    for column in columns:
+        kind = {type(i) for i in column}
+        if kind <= {int}:
+            data = array('q', column).tobytes()
+            code = b'q'
+        elif kind <= {int, float}:
+            data = array('d', column).tobytes()
+            code = b'd'
+        elif _spread(column):
+            data = '\0'.join('\t'.join(map(str, i)) for i in column).encode()
+            code = b's'
+        else:
+            data = '\0'.join(map(str, column)).encode()
+            code = b's'
+        tmp.extend([code, _LENGTH.pack(len(data)), data])
+    return b''.join(tmp)
+
+
+def readresults(path):
+    '''
+    readresults(path) -> [column, ...]
+    Read a binary file of ResultWriter (compressed or not) back into
+    columns, int and float columns are arrays and str columns are lists.
+    '''
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    with (gzip.open if magic == b'\x1f\x8b' else open)(path, 'rb') as f:
+        data = f.read()
+    assert data[:len(_MAGIC)] == _MAGIC, 'Error: {} is not a binary result file'.format(path)
+    columns = None
+    n = len(_MAGIC)
+    while n < len(data):
+        rows, ncol = _COUNT.unpack_from(data, n)
+        n += _COUNT.size
+        if columns is None:
+            columns = [None] * ncol
+        for k in range(ncol):
+            code = data[n:n + 1].decode()
+            size = _LENGTH.unpack_from(data, n + 1)[0]
+            n += 1 + _LENGTH.size
+            if code == 's':
+                values = data[n:n + size].decode().split('\0') if rows else []
+            else:
+                values = array(code, data[n:n + size])
+            if columns[k] is None:
+                columns[k] = values
+            elif type(columns[k]) is not type(values):
+                columns[k] = list(columns[k]) + list(values)
+            elif code == 'q' and columns[k].typecode == 'd':
+                columns[k].extend(map(float, values))
+            elif code == 'd' and columns[k].typecode == 'q':
+                columns[k] = array('d', columns[k])
+                columns[k].extend(values)
+            else:
+                columns[k].extend(values)
+            n += size
+    return columns or []
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+'''
+benchmark.py - Benchmark Interval and map.py on synthetic intervals.
+author: Xiao-Ou Zhang
+version: 0.1.0
+'''
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'python'))
+from interval import Interval
+from map import MapIndex
+
+
+def generate(n, density=0.1, overlap=0.3, length=500, spread=0.5, tags=1,
+             seed=0):
+    '''
+    generate(n, density, overlap, length, spread, tags, seed) -> interval
+    n random intervals in shuffled order. The genome is sized so that the
+    intervals would cover a fraction 'density' of it if none overlapped,
+    a fraction 'overlap' of them start inside the previous interval,
+    lengths are log-normal with mean 'length' and sigma 'spread', and every
+    interval has 'tags' tag fields.
+    '''
+    rand = random.Random(seed)
+    size = max(int(n * length / density), 1)
+    mu = math.log(length) - spread * spread / 2
+    tmp = []
+    for k in range(n):
+        if tmp and rand.random() < overlap:
+            sta = rand.randint(tmp[-1][0], tmp[-1][1])
+        else:
+            sta = rand.randrange(size)
+        end = sta + max(int(rand.lognormvariate(mu, spread)), 1)
+        tmp.append([sta, end] + ['t{}_{}'.format(k, i) for i in range(tags)])
+    rand.shuffle(tmp)
+    return tmp
+
+
+def cases(a, b, reads, queries):
+    '''
+    cases(a, b, reads, queries) -> [(name, function), ...]
+    The timed operations, a and b are nested lists of features.
+    '''
+    x, y = Interval(a), Interval(b)
+    index = MapIndex(a)
+
+    def contains():
+        return sum(1 for i in queries if i in x)
+
+    def complement():
+        tmp = Interval.fromsorted(x.interval)
+        tmp.complement(0, queries[-1][1])
+        return tmp
+
+    return [('Interval', lambda: Interval(a)),
+            ('add', lambda: x + y),
+            ('mul', lambda: x * y),
+            ('sub', lambda: x - y),
+            ('complement', complement),
+            ('contains', contains),
+            ('MapIndex', lambda: MapIndex(a)),
+            ('mapto', lambda: index.mapto(reads)),
+            ('overlapwith', lambda: index.overlapwith(reads))]
+
+
+def measure(func, repeat):
+    '''
+    measure(func, repeat) -> (seconds, peak_bytes)
+    Best time of repeat runs, then the peak memory allocated by one run
+    under tracemalloc (timed separately, tracing slows python down).
+    '''
+    best = float('inf')
+    for i in range(repeat):
+        sta = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - sta)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def commit():
+    '''
+    commit() -> str
+    The git commit of the tree being benchmarked, if any.
+    '''
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def run(args):
+    results = []
+    for n in args.sizes:
+        params = dict(density=args.density, overlap=args.overlap,
+                      length=args.length, spread=args.spread, tags=args.tags)
+        a = generate(n, seed=args.seed, **params)
+        b = generate(n, seed=args.seed + 1, **params)
+        reads = generate(n, seed=args.seed + 2, **dict(params, length=100))
+        queries = sorted(i[:2] for i in generate(min(n, 10000),
+                                                 seed=args.seed + 3,
+                                                 **dict(params, length=100)))
+        for name, func in cases(a, b, reads, queries):
+            if args.ops and name not in args.ops:
+                continue
+            seconds, peak = measure(func, args.repeat)
+            results.append({'op': name, 'n': n, 'seconds': seconds,
+                            'peak_bytes': peak})
+            print('{:<12}{:>10}{:>12.4f} s{:>12.1f} MB'.format(
+                name, n, seconds, peak / pow(2, 20)), file=sys.stderr)
+    return {'commit': commit(), 'python': platform.python_version(),
+            'platform': platform.platform(), 'params': vars(args),
+            'results': results}
+
+
+def compare(old, new):
+    '''
+    compare(old, new)
+    Print the time and memory ratios (new / old) of two JSON results.
+    '''
+    before = {(i['op'], i['n']): i for i in old['results']}
+    print('{:<12}{:>10}{:>10}{:>10}'.format('op', 'n', 'time', 'memory'))
+    for i in new['results']:
+        j = before.get((i['op'], i['n']))
+        if j:
+            print('{:<12}{:>10}{:>10.2f}{:>10.2f}'.format(
+                i['op'], i['n'], i['seconds'] / j['seconds'],
+                i['peak_bytes'] / max(j['peak_bytes'], 1)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        type=lambda s: [int(float(i)) for i in s.split(',')],
+                        help='numbers of intervals, e.g. 1e3,1e5,1e7')
+    parser.add_argument('--density', type=float, default=0.1)
+    parser.add_argument('--overlap', type=float, default=0.3)
+    parser.add_argument('--length', type=int, default=500)
+    parser.add_argument('--spread', type=float, default=0.5)
+    parser.add_argument('--tags', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--ops', type=lambda s: s.split(','), default=None,
+                        help='only run these operations')
+    parser.add_argument('-o', '--output', help='write results as JSON')
+    parser.add_argument('--compare', help='JSON results to compare with')
+    args = parser.parse_args()
+    output, old = args.output, args.compare
+    del args.output, args.compare
+    result = run(args)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=1)
+    else:
+        json.dump(result, sys.stdout, indent=1)
+        print()
+    if old:
+        with open(old) as f:
+            compare(json.load(f), result)
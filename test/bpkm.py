@@ -8,9 +8,12 @@ version: 0.2.0
 import sys
 sys.path.insert(0, '/picb/rnomics1/xiaoou/program/usefullib/python')
 from map import mapto
-from subprocess import Popen, PIPE
+from bam import BamPool
+from writer import ResultWriter
 import os
 
+pool = BamPool()
+
 
 def calculatebpkm(chrom, sta, end, bam, total=0, length=0, getsegment=False):
     '''
@@ -23,15 +26,8 @@ def calculatebpkm(chrom, sta, end, bam, total=0, length=0, getsegment=False):
     length = int(length)
     if sta == end:
         return 0
-    read_segments = []
-    with Popen(['samtools', 'view', bam, '{}:{}-{}'.format(chrom, sta, end)],
-            stdout=PIPE) as proc:
-        for line in proc.stdout:
-            str_line = line.decode('utf-8')
-            pos = str_line.split()[3]
-            cigar = str_line.split()[5]
-            segment = readsplit(pos, cigar)
-            read_segments.extend(segment)
+    with pool.open(bam) as bamf:
+        read_segments = bamf.fetch_blocks(chrom, sta, end)
     if not read_segments:
         return 0
     mapped_read_segments = mapto(read_segments, [[sta, end]])
@@ -44,48 +40,20 @@ def calculatebpkm(chrom, sta, end, bam, total=0, length=0, getsegment=False):
         return mapped_read_segments
 
 
-def readsplit(pos1, cigar):
-    '''
-    readsplit(pos, cigar) -> interval
-    Split reads.
-    '''
-    pos2, num = (int(pos1), '')
-    interval = []
-    for i in cigar:
-        if 48 <= ord(i) <= 57:
-            num += i
-            continue
-        elif i == 'M' or i == 'D':
-            pos2 += int(num)
-            num = ''
-            continue
-        elif i == 'I':
-            num = ''
-            continue
-        elif i == 'N':
-            interval.append([int(pos1), pos2])
-            pos1 = pos2 + int(num)
-            pos2 = pos1
-            num = ''
-    interval.append([int(pos1), pos2])
-    return interval
-
 if __name__ == '__main__':
     if len(sys.argv) != 4:
         print('bpkm.py *.bed *.bam length')
         sys.exit(0)
     name = os.path.splitext(os.path.split(sys.argv[1])[1])[0]
     bam, length = sys.argv[2:5]
-    size = 0
-    with Popen(['samtools', 'idxstats', bam], stdout=PIPE) as proc:
-        for line in proc.stdout:
-            str_line = line.decode('utf-8')
-            size += int(str_line.split()[2])
+    with pool.open(bam) as bamf:
+        size = bamf.mapped
+    pos, bpkm, remaining = [], [], []
     with open(sys.argv[1], 'r') as f:
-        with open('{}.bpkm'.format(name), 'w') as outf:
-            for line in f:
-                chrom, sta, end, *remaining = line.split()
-                bpkm = calculatebpkm(chrom, sta, end, bam, size, length)
-                pos = '{}:{}-{}'.format(chrom, sta, end)
-                result = '\t'.join([pos, str(bpkm)] + remaining)
-                outf.write('{}\n'.format(result))
+        for line in f:
+            chrom, sta, end, *rest = line.split()
+            bpkm.append(calculatebpkm(chrom, sta, end, bam, size, length))
+            pos.append('{}:{}-{}'.format(chrom, sta, end))
+            remaining.append(rest)
+    with ResultWriter('{}.bpkm'.format(name)) as outf:
+        outf.extend(pos, bpkm, remaining)
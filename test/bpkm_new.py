@@ -7,52 +7,33 @@ version: 0.3.0
 
 import sys
 sys.path.insert(0, '/picb/rnomics1/xiaoou/program/usefullib/python')
-from map import mapto
+from map import mapto_compact
+from cigar import readsplit
+from writer import ResultWriter
 import os
 
 
 def calculatebpkm(index, read, chrom, total, length, out):
     total = int(total)
     length = int(length)
-    mapped_read_segments = mapto(read, index)
+    sta, end, dex, _ = mapto_compact(read, index)
     interval = {}
-    for i in mapped_read_segments:
-        if i[2] in interval:
-            interval[i[2]] += i[1] - i[0]
-        else:
-            interval[i[2]] = i[1] - i[0]
+    for a, b, n in zip(sta, end, dex):
+        key = index[n][2]
+        interval[key] = interval.get(key, 0) + b - a
+    pos, bpkm = [], []
     for i in index:
         sta, end = i[0:2]
         sta = int(sta)
         end = int(end)
+        pos.append('{}:{}-{}'.format(chrom, sta, end))
         if i[2] in interval:
-            bpkm = interval[i[2]] * pow(10, 9) / (total * length * (end - sta))
-            out.write('{}:{}-{}\t{}\n'.format(chrom, sta, end, bpkm))
+            bpkm.append(interval[i[2]] * pow(10, 9) /
+                        (total * length * (end - sta)))
         else:
-            out.write('{}:{}-{}\t{}\n'.format(chrom, sta, end, 0))
-
+            bpkm.append(0)
+    out.extend(pos, bpkm)
 
-def readsplit(pos1, cigar):
-    pos2, num = (int(pos1), '')
-    interval = []
-    for i in cigar:
-        if 48 <= ord(i) <= 57:
-            num += i
-            continue
-        elif i == 'M' or i == 'D':
-            pos2 += int(num)
-            num = ''
-            continue
-        elif i == 'I':
-            num = ''
-            continue
-        elif i == 'N':
-            interval.append([int(pos1), pos2])
-            pos1 = pos2 + int(num)
-            pos2 = pos1
-            num = ''
-    interval.append([int(pos1), pos2])
-    return interval
 
 if __name__ == '__main__':
     if len(sys.argv) != 5:
@@ -63,7 +44,7 @@ if __name__ == '__main__':
     index = {'chr' + str(i): [] for i in list(range(1, 23)) + ['X', 'Y']}
     read = {'chr' + str(i): [] for i in list(range(1, 23)) + ['X', 'Y']}
     chrom_list = ['chr' + str(i) for i in list(range(1, 23)) + ['X', 'Y']]
-    with open('{}.bpkm'.format(name), 'w') as outf:
+    with ResultWriter('{}.bpkm'.format(name)) as outf:
         with open(sys.argv[1], 'r') as f:
             print('read bed...')
             for line in f: